@@ -0,0 +1,141 @@
+import hashlib
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Recipe
+
+VERSION_KEY = 'version:{namespace}'
+STATS_KEY = 'stats:{namespace}:{result}'
+
+
+def get_cache_version(namespace):
+    """Возвращает текущую версию закэшированных данных namespace."""
+    version = cache.get(VERSION_KEY.format(namespace=namespace))
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(VERSION_KEY.format(namespace=namespace), version,
+                         timeout=None):
+            version = cache.get(VERSION_KEY.format(namespace=namespace))
+    return version
+
+
+def bump_cache_version(namespace):
+    """Делает устаревшими все закэшированные данные namespace."""
+    cache.set(
+        VERSION_KEY.format(namespace=namespace), uuid4().hex, timeout=None
+    )
+
+
+def count_cache_access(namespace, hit):
+    """Увеличивает счетчик попаданий или промахов кэша namespace."""
+    key = STATS_KEY.format(
+        namespace=namespace, result='hits' if hit else 'misses'
+    )
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_cache_stats(namespace):
+    """Возвращает количество попаданий и промахов кэша namespace."""
+    return {
+        result: cache.get(
+            STATS_KEY.format(namespace=namespace, result=result), 0
+        )
+        for result in ('hits', 'misses')
+    }
+
+
+def normalized_query(request):
+    """Возвращает параметры запроса в отсортированном виде."""
+    return urlencode(sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    ))
+
+
+class VersionedCacheMixin:
+    """Кэширует готовый json списка объектов до изменения версии.
+
+    Версия namespace меняется сигналами при изменении данных,
+    ответы отдаются с ETag и поддерживают 304 Not Modified.
+    """
+    cache_namespace = None
+    cache_timeout = None
+
+    def use_response_cache(self, request):
+        """Определяет, можно ли отдать ответ из общего кэша."""
+        return request.accepted_renderer.format == 'json'
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_response_cache(request):
+            return super().list(request, *args, **kwargs)
+        key = 'response:{namespace}:{version}:{host}:{query}'.format(
+            namespace=self.cache_namespace,
+            version=get_cache_version(self.cache_namespace),
+            host=request.get_host(),
+            query=normalized_query(request)
+        )
+        cached = cache.get(key)
+        count_cache_access(self.cache_namespace, cached is not None)
+        if cached is None:
+            data = super().list(request, *args, **kwargs).data
+            body = JSONRenderer().render(data)
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            timeout = self.cache_timeout
+            if timeout is None:
+                timeout = settings.REFERENCE_CACHE_TIMEOUT
+            cache.set(key, (etag, body), timeout)
+        else:
+            etag, body = cached
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+def recipe_validators(request, pk):
+    """Возвращает ETag и время изменения рецепта для текущего пользователя.
+
+    Признаки избранного, списка покупок и подписки входят в ETag, поэтому
+    у разных пользователей он разный. Возвращает (None, None),
+    если рецепт не найден.
+    """
+    try:
+        state = Recipe.objects.with_user_flags(request.user).filter(
+            pk=pk
+        ).values(
+            'updated_at', 'favourites_count', 'shopping_cart_count',
+            'is_favorited', 'is_in_shopping_cart', 'is_author_subscribed',
+            'author_id', 'author__username', 'author__email',
+            'author__first_name', 'author__last_name',
+            'author__counters__updated_at',
+        ).first()
+    except (TypeError, ValueError):
+        state = None
+    if state is None:
+        return None, None
+    state['host'] = request.get_host()
+    state['format'] = request.accepted_renderer.format
+    digest = hashlib.sha1(
+        repr(sorted(state.items())).encode()
+    ).hexdigest()
+    last_modified = max(
+        filter(None, (
+            state['updated_at'], state['author__counters__updated_at']
+        ))
+    )
+    return f'W/"{digest}"', int(last_modified.timestamp())
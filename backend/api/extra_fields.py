@@ -1,16 +1,140 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 
-from .serializers import serializers
+from rest_framework import serializers
+
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+BASE64_MARKER = ';base64,'
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+def sniff_image(file):
+    """Возвращает формат и размеры изображения по его заголовку.
+
+    Читает только начало файла, возвращает None, если заголовок
+    еще не получен целиком или данные не являются изображением.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            return image.format, image.size
+    except (OSError, SyntaxError, ValueError):
+        return None
+    finally:
+        file.seek(0, 2)
 
 
 class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+    """Поле изображения, принимающее картинку в виде data URI.
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+    Данные декодируются по частям во временный файл, размер и габариты
+    изображения проверяются до полного декодирования, а формат
+    определяется по содержимому, а не по префиксу data:image/...
+    """
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные изображения.',
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'too_big_dimensions': (
+            'Размеры изображения не должны превышать {max_dimension} px.'
+        ),
+        'invalid_format': 'Допустимые форматы изображения: {formats}.',
+    }
 
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:'):
+            # Изображение уже проверено при декодировании, поэтому
+            # повторная проверка ImageField с копированием файла
+            # в память не нужна.
+            return super(serializers.ImageField, self).to_internal_value(
+                self.decode(data)
+            )
         return super().to_internal_value(data)
+
+    def decode(self, data):
+        """Декодирует data URI во временный файл."""
+        start = data.find(BASE64_MARKER, 0, 256)
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(BASE64_MARKER)
+        if (len(data) - start) // 4 * 3 > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+        file = SpooledTemporaryFile(
+            max_size=settings.IMAGE_SPOOL_MAX_MEMORY
+        )
+        try:
+            image_format = self.write_image(file, data, start)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        size = file.tell()
+        file.seek(0)
+        return UploadedFile(
+            file, name='temp.' + IMAGE_FORMATS[image_format],
+            content_type=Image.MIME[image_format], size=size
+        )
+
+    def write_image(self, file, data, start):
+        """Пишет декодированное изображение в файл и возвращает его формат."""
+        header = None
+        try:
+            for position in range(start, len(data), BASE64_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    data[position:position + BASE64_CHUNK_SIZE],
+                    validate=True
+                ))
+                if header is None:
+                    header = sniff_image(file)
+                    if header is not None:
+                        self.validate_header(*header)
+            if header is None:
+                self.fail('invalid_image')
+            file.seek(0)
+            with Image.open(file) as image:
+                image.verify()
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+        except (OSError, SyntaxError):
+            self.fail('invalid_image')
+        file.seek(0, 2)
+        return header[0]
+
+    def validate_header(self, image_format, dimensions):
+        """Проверяет формат и размеры изображения по заголовку."""
+        if image_format not in IMAGE_FORMATS:
+            self.fail('invalid_format', formats=', '.join(IMAGE_FORMATS))
+        if max(dimensions) > settings.IMAGE_MAX_DIMENSION:
+            self.fail(
+                'too_big_dimensions',
+                max_dimension=settings.IMAGE_MAX_DIMENSION
+            )
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта.
+
+    Пока копия размера не создана, для него отдается исходная картинка.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return {}
+        request = self.context.get('request')
+        storage = recipe.image.storage
+        current = recipe.image_variants.get('source') == recipe.image.name
+        variants = {}
+        for name in settings.RECIPE_IMAGE_VARIANTS:
+            path = recipe.image_variants.get(name) if current else None
+            url = storage.url(path) if path else recipe.image.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            variants[name] = url
+        return variants
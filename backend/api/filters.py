@@ -1,7 +1,10 @@
+from django.conf import settings
+
 from django_filters import rest_framework
 
 from rest_framework import filters
 
+from .ingredient_index import ingredient_index
 from .views import Recipe, Tag, User
 
 
@@ -17,21 +20,28 @@ class RecipeFilter(rest_framework.FilterSet):
         method='is_favorited_method')
     is_in_shopping_cart = rest_framework.BooleanFilter(
         method='is_in_shopping_cart_method')
+    search = rest_framework.CharFilter(method='search_method')
 
     def is_favorited_method(self, queryset, name, value):
         """Возвращает рецепты авторов, на которых подписан пользователь
             или все рецепты в зависимости от запроса."""
         if value:
-            queryset = queryset.filter(favourite__user=self.request.user)
+            queryset = queryset.filter(is_favorited=True)
         return queryset
 
     def is_in_shopping_cart_method(self, queryset, name, value):
         """Возвращает рецепты, которые внесены в список покупок
             или все рецепты в зависимости от запроса."""
         if value:
-            queryset = queryset.filter(
-                in_shopping_cart__user=self.request.user
-            )
+            queryset = queryset.filter(is_in_shopping_cart=True)
+        return queryset
+
+    def search_method(self, queryset, name, value):
+        """Возвращает рецепты, подходящие под поисковый запрос,
+            упорядоченные по релевантности."""
+        value = value.strip()
+        if value:
+            queryset = queryset.search(value)
         return queryset
 
     class Meta:
@@ -40,5 +50,17 @@ class RecipeFilter(rest_framework.FilterSet):
 
 
 class IngredientFilter(filters.SearchFilter):
-    """Меняет старнартный парметр поиска 'search' на 'name'."""
+    """Меняет старнартный парметр поиска 'search' на 'name'.
+
+    Поиск по началу названия в списке ингредиентов выполняется
+    по индексу в памяти, без запроса к базе данных.
+    """
     search_param = 'name'
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name or view.action != 'list':
+            return super().filter_queryset(request, queryset, view)
+        return ingredient_index.search(
+            name, settings.INGREDIENT_SEARCH_LIMIT
+        )
@@ -0,0 +1,73 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+from .caching import get_cache_version
+
+
+class IngredientPrefixIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Индекс строится при первом поиске и перестраивается, когда меняется
+    версия кэша ingredients: ее меняют сигналы в любом процессе,
+    поэтому изменения видны во всех воркерах сразу. Кроме того, индекс
+    перестраивается не реже, чем раз в ttl секунд.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._keys = []
+        self._ingredients = []
+        self._built_at = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Сбрасывает индекс, он будет построен заново при поиске."""
+        self._built_at = None
+
+    def _is_fresh(self, version):
+        return (
+            self._built_at is not None
+            and self._version == version
+            and time.monotonic() - self._built_at < self.ttl
+        )
+
+    def _build(self, version):
+        ingredients = sorted(
+            Ingredient.objects.order_by().only(
+                'id', 'name', 'measurement_unit'
+            ),
+            key=lambda ingredient: (ingredient.name.casefold(), ingredient.id)
+        )
+        self._keys = [ingredient.name.casefold() for ingredient in ingredients]
+        self._ingredients = ingredients
+        self._built_at = time.monotonic()
+        self._version = version
+
+    def search(self, prefix, limit):
+        """Возвращает не более limit ингредиентов, название которых
+            начинается с prefix без учета регистра."""
+        version = get_cache_version('ingredients')
+        if not self._is_fresh(version):
+            with self._lock:
+                if not self._is_fresh(version):
+                    self._build(version)
+        keys, ingredients = self._keys, self._ingredients
+        prefix = prefix.casefold()
+        result = []
+        index = bisect_left(keys, prefix)
+        while (
+            index < len(keys) and len(result) < limit
+            and keys[index].startswith(prefix)
+        ):
+            result.append(ingredients[index])
+            index += 1
+        return result
+
+
+ingredient_index = IngredientPrefixIndex(ttl=settings.INGREDIENT_INDEX_TTL)
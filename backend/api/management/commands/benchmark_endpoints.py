@@ -0,0 +1,333 @@
+import base64
+import json
+import math
+import tempfile
+import time
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+from PIL import Image
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Favourites, Ingredient, Recipe, Tag, User
+from users.models import Follow
+
+# Максимальное количество SQL-запросов на один вызов каждого эндпоинта.
+QUERY_BUDGETS = {
+    'tags-list': 2,
+    'tags-retrieve': 1,
+    'ingredients-list': 2,
+    'ingredients-retrieve': 1,
+    'recipes-list-anonymous': 6,
+    'recipes-list': 7,
+    'recipes-list-cursor': 6,
+    'recipes-retrieve': 7,
+    'recipes-feed': 7,
+    'recipes-similar': 5,
+    'recipes-create': 22,
+    'recipes-update': 24,
+    'recipes-favorite': 8,
+    'recipes-unfavorite': 8,
+    'recipes-shopping-cart': 14,
+    'recipes-remove-from-shopping-cart': 14,
+    'recipes-download-shopping-cart': 4,
+    'users-list': 4,
+    'users-retrieve': 3,
+    'users-me': 3,
+    'users-subscriptions': 5,
+    'users-subscribe': 11,
+    'users-unsubscribe': 10,
+}
+PERCENTILES = (50, 95, 99)
+BENCHMARK_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+def percentile(values, percent):
+    """Процентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+def png_data_uri():
+    """Небольшая картинка в виде data URI для создания рецептов."""
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), '#49B64E').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class Case:
+    """Замеряемый запрос к API.
+
+    prepare и cleanup выполняются до и после каждого замера
+    и в результаты не входят.
+    """
+
+    def __init__(self, name, request, prepare=None, cleanup=None):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+        self.cleanup = cleanup
+
+
+class Command(BaseCommand):
+    """Замеряет время ответа и количество SQL-запросов эндпоинтов API.
+
+    Работает на отдельной тестовой базе с фиксированным набором данных
+    и завершается с ошибкой, если количество запросов превышает бюджет.
+    Локально без PostgreSQL запускается с DB_ENGINE=sqlite.
+    """
+
+    help = ('Замеряет время ответа и количество запросов эндпоинтов API. '
+            'Без PostgreSQL запускайте с переменной окружения '
+            'DB_ENGINE=sqlite.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=300)
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help='Сколько раз вызвать каждый эндпоинт.'
+        )
+        parser.add_argument(
+            '--output', help='Файл для отчета json, по умолчанию stdout.'
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0,
+                                      CACHES=BENCHMARK_CACHES):
+                context = self.seed(options)
+                report = self.run(context, options['iterations'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        report['dataset'] = {
+            name: options[name]
+            for name in ('users', 'recipes', 'ingredients')
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+        if report['failed']:
+            raise CommandError(
+                'Эндпоинты вернули ошибку: ' + ', '.join(report['failed'])
+            )
+        if report['over_budget']:
+            raise CommandError(
+                'Превышен бюджет запросов: '
+                + ', '.join(report['over_budget'])
+            )
+
+    def seed(self, options):
+        """Создает фиксированный набор данных и возвращает его описание."""
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index:04}', measurement_unit='г')
+            for index in range(options['ingredients'])
+        )
+        call_command(
+            'generate_dataset', users=options['users'],
+            recipes=options['recipes'], seed=0, stdout=StringIO()
+        )
+        user = User.objects.order_by('pk').first()
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+        others = Recipe.objects.exclude(author=user).order_by('pk')
+        recipe = others.exclude(favourite__user=user).exclude(
+            in_shopping_cart__user=user
+        ).first()
+        author = User.objects.exclude(pk=user.pk).exclude(
+            following__user=user
+        ).order_by('pk').first()
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        recipe_data = {
+            'name': 'Рецепт для замеров',
+            'text': 'Текст рецепта.',
+            'cooking_time': 10,
+            'tags': [Tag.objects.order_by('pk').first().pk],
+            'ingredients': [
+                {'id': pk, 'amount': 100} for pk in ingredient_ids[:10]
+            ],
+            'image': png_data_uri(),
+        }
+        own_recipe = client.post(
+            '/api/recipes/', recipe_data, format='json'
+        ).json()['id']
+        return {
+            'user': user,
+            'client': client,
+            'anonymous': APIClient(),
+            'recipe': recipe,
+            'author': author,
+            'own_recipe': own_recipe,
+            'recipe_data': recipe_data,
+            'ingredient_ids': ingredient_ids,
+            'tag': Tag.objects.order_by('pk').first(),
+            'ingredient': Ingredient.objects.order_by('pk').first(),
+        }
+
+    def cases(self, ctx):
+        client, anonymous = ctx['client'], ctx['anonymous']
+        user, recipe, author = ctx['user'], ctx['recipe'], ctx['author']
+
+        def update(iteration):
+            data = dict(ctx['recipe_data'])
+            shift = iteration % 5
+            data['ingredients'] = [
+                {'id': pk, 'amount': 100 + iteration}
+                for pk in ctx['ingredient_ids'][shift:shift + 10]
+            ]
+            return client.patch(
+                f'/api/recipes/{ctx["own_recipe"]}/', data, format='json'
+            )
+
+        def created(iteration):
+            Recipe.objects.filter(
+                author=user, name=ctx['recipe_data']['name']
+            ).exclude(pk=ctx['own_recipe']).delete()
+
+        return [
+            Case('tags-list', lambda i: anonymous.get('/api/tags/')),
+            Case('tags-retrieve', lambda i: anonymous.get(
+                f'/api/tags/{ctx["tag"].pk}/'
+            )),
+            Case('ingredients-list', lambda i: anonymous.get(
+                '/api/ingredients/?name=ингредиент 01'
+            )),
+            Case('ingredients-retrieve', lambda i: anonymous.get(
+                f'/api/ingredients/{ctx["ingredient"].pk}/'
+            )),
+            Case('recipes-list-anonymous', lambda i: anonymous.get(
+                f'/api/recipes/?page={i % 5 + 1}'
+            )),
+            Case('recipes-list', lambda i: client.get(
+                f'/api/recipes/?page={i % 5 + 1}'
+            )),
+            Case('recipes-list-cursor', lambda i: client.get(
+                '/api/recipes/?cursor='
+            )),
+            Case('recipes-retrieve', lambda i: client.get(
+                f'/api/recipes/{recipe.pk}/'
+            )),
+            Case('recipes-similar', lambda i: anonymous.get(
+                f'/api/recipes/{recipe.pk}/similar/'
+            )),
+            Case('recipes-feed', lambda i: client.get(
+                f'/api/recipes/feed/?page={i % 3 + 1}'
+            )),
+            Case('recipes-create', lambda i: client.post(
+                '/api/recipes/', ctx['recipe_data'], format='json'
+            ), cleanup=created),
+            Case('recipes-update', update),
+            Case('recipes-favorite', lambda i: client.post(
+                f'/api/recipes/{recipe.pk}/favorite/'
+            ), cleanup=lambda i: Favourites.objects.filter(
+                user=user, recipe=recipe
+            ).delete()),
+            Case('recipes-unfavorite', lambda i: client.delete(
+                f'/api/recipes/{recipe.pk}/favorite/'
+            ), prepare=lambda i: Favourites.objects.create(
+                user=user, recipe=recipe
+            )),
+            Case('recipes-shopping-cart', lambda i: client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            ), cleanup=lambda i: client.delete(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            )),
+            Case('recipes-remove-from-shopping-cart', lambda i: client.delete(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            ), prepare=lambda i: client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            )),
+            Case('recipes-download-shopping-cart', lambda i: client.get(
+                '/api/recipes/download_shopping_cart/'
+            )),
+            Case('users-list', lambda i: client.get('/api/users/')),
+            Case('users-retrieve', lambda i: client.get(
+                f'/api/users/{author.pk}/'
+            )),
+            Case('users-me', lambda i: client.get('/api/users/me/')),
+            Case('users-subscriptions', lambda i: client.get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            )),
+            Case('users-subscribe', lambda i: client.post(
+                f'/api/users/{author.pk}/subscribe/'
+            ), cleanup=lambda i: Follow.objects.filter(
+                user=user, following=author
+            ).delete()),
+            Case('users-unsubscribe', lambda i: client.delete(
+                f'/api/users/{author.pk}/subscribe/'
+            ), prepare=lambda i: Follow.objects.create(
+                user=user, following=author
+            )),
+        ]
+
+    def measure(self, case, iteration):
+        """Выполняет запрос и возвращает статус, время и число запросов."""
+        if case.prepare:
+            case.prepare(iteration)
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = case.request(iteration)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if case.cleanup:
+            case.cleanup(iteration)
+        return response.status_code, elapsed, len(queries)
+
+    def run(self, context, iterations):
+        endpoints = {}
+        over_budget = []
+        failed = []
+        for case in self.cases(context):
+            results = [
+                self.measure(case, iteration)
+                for iteration in range(iterations)
+            ]
+            timings = [elapsed * 1000 for _, elapsed, _ in results]
+            queries = [count for _, _, count in results]
+            result = {
+                'statuses': sorted({status for status, _, _ in results}),
+                'queries_max': max(queries),
+                'queries_budget': QUERY_BUDGETS[case.name],
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'max_ms': round(max(timings), 2),
+            }
+            for percent in PERCENTILES:
+                result[f'p{percent}_ms'] = round(
+                    percentile(timings, percent), 2
+                )
+            if result['queries_max'] > result['queries_budget']:
+                over_budget.append(case.name)
+            if max(result['statuses']) >= 400:
+                failed.append(case.name)
+            endpoints[case.name] = result
+        return {
+            'iterations': iterations,
+            'endpoints': endpoints,
+            'over_budget': over_budget,
+            'failed': failed,
+        }
@@ -0,0 +1,70 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    """Сравнивает поиск ингредиентов по индексу в памяти и в базе."""
+
+    help = 'Сравнивает скорость поиска ингредиентов по началу названия.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefix-length', type=int, default=2,
+            help='Длина префиксов, взятых из названий ингредиентов.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз повторить поиск по каждому префиксу.'
+        )
+
+    def measure(self, search, prefixes, repeat):
+        timings = []
+        for _ in range(repeat):
+            for prefix in prefixes:
+                start = time.perf_counter()
+                search(prefix)
+                timings.append(time.perf_counter() - start)
+        timings.sort()
+        return {
+            'avg': sum(timings) / len(timings),
+            'p50': timings[len(timings) // 2],
+            'p95': timings[int(len(timings) * 0.95)],
+        }
+
+    def handle(self, *args, **options):
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        prefixes = sorted({
+            name[:options['prefix_length']].lower()
+            for name in Ingredient.objects.values_list('name', flat=True)
+        })
+        if not prefixes:
+            raise CommandError('Нет ингредиентов, загрузите их: load_data.')
+        ingredient_index.invalidate()
+        ingredient_index.search('', limit)
+        results = {
+            'База данных': self.measure(
+                lambda prefix: list(
+                    Ingredient.objects.filter(name__istartswith=prefix)[:limit]
+                ),
+                prefixes, options['repeat']
+            ),
+            'Индекс в памяти': self.measure(
+                lambda prefix: ingredient_index.search(prefix, limit),
+                prefixes, options['repeat']
+            ),
+        }
+        self.stdout.write(
+            f'Префиксов: {len(prefixes)}, повторов: {options["repeat"]}, '
+            f'лимит: {limit}.'
+        )
+        for name, timing in results.items():
+            self.stdout.write(
+                f'{name}: среднее {timing["avg"] * 1000:.3f} мс, '
+                f'p50 {timing["p50"] * 1000:.3f} мс, '
+                f'p95 {timing["p95"] * 1000:.3f} мс.'
+            )
@@ -0,0 +1,175 @@
+import json
+import random
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import (override_settings, setup_databases,
+                               setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+
+from recipes.models import Ingredient, IngredientAmount, Recipe
+from recipes.similarity import recipe_features, similar_recipe_ids
+
+from .benchmark_endpoints import BENCHMARK_CACHES, PERCENTILES, percentile
+from .generate_dataset import fetch_ids
+
+
+def exact_similar_recipe_ids(recipe_id, limit):
+    """Похожие рецепты полным перебором всех рецептов с общими
+        ингредиентами, для сравнения с индексом."""
+    candidates = list(IngredientAmount.objects.filter(
+        ingredient__in=IngredientAmount.objects.filter(
+            recipe_id=recipe_id
+        ).values('ingredient_id')
+    ).exclude(recipe_id=recipe_id).values_list(
+        'recipe_id', flat=True
+    ).distinct())
+    features = recipe_features([recipe_id, *candidates])
+    target = features.pop(recipe_id)
+
+    def similarity(pk):
+        return len(target & features[pk]) / len(target | features[pk])
+
+    scores = {pk: similarity(pk) for pk in candidates}
+    return sorted(candidates, key=lambda pk: (-scores[pk], -pk))[:limit]
+
+
+class Command(BaseCommand):
+    """Замеряет поиск похожих рецептов по индексу LSH и полным перебором.
+
+    Работает на отдельной тестовой базе с синтетическими рецептами.
+    Для части рецептов создаются варианты с одним замененным
+    ингредиентом, полнота считается по тому, нашелся ли вариант.
+    """
+
+    help = 'Замеряет время поиска похожих рецептов и полноту индекса.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--samples', type=int, default=200,
+            help='Для скольких случайных рецептов создать варианты '
+                 'и искать похожие.'
+        )
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument(
+            '--output', help='Файл для отчета json, по умолчанию stdout.'
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0,
+                                      CACHES=BENCHMARK_CACHES):
+                self.seed(options)
+                report = self.run()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        report['dataset'] = {
+            name: options[name]
+            for name in ('users', 'recipes', 'ingredients')
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def seed(self, options):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index:05}', measurement_unit='г')
+            for index in range(options['ingredients'])
+        )
+        call_command(
+            'generate_dataset', users=options['users'],
+            recipes=options['recipes'], processes=options['processes'],
+            follows=0, favourites=0, cart=0, seed=0, stdout=StringIO()
+        )
+        self.variants = self.create_variants(options['samples'])
+        started = time.monotonic()
+        call_command('rebuild_similar_recipes', stdout=StringIO())
+        self.rebuild_seconds = time.monotonic() - started
+
+    def create_variants(self, count):
+        """Создает для случайных рецептов варианты, отличающиеся
+            одним ингредиентом, и возвращает {id рецепта: id варианта}."""
+        rng = random.Random(0)
+        originals = rng.sample(
+            list(Recipe.objects.values_list('pk', flat=True)),
+            min(count, Recipe.objects.count())
+        )
+        ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)
+        )
+        ingredients = {}
+        for recipe_id, ingredient_id in IngredientAmount.objects.filter(
+            recipe_id__in=originals
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredients.setdefault(recipe_id, []).append(ingredient_id)
+        variants = []
+        for recipe in Recipe.objects.filter(pk__in=originals):
+            variant = Recipe(
+                author_id=recipe.author_id, name=f'{recipe.name} вариант',
+                text=recipe.text, cooking_time=recipe.cooking_time,
+                image=recipe.image.name, image_variants=recipe.image_variants
+            )
+            variant.original_id = recipe.pk
+            variants.append(variant)
+        Recipe.objects.bulk_create(variants)
+        fetch_ids(variants, Recipe.objects.all(), 'name')
+        amounts = []
+        for variant in variants:
+            chosen = ingredients[variant.original_id][:]
+            chosen[rng.randrange(len(chosen))] = rng.choice([
+                pk for pk in ingredient_ids if pk not in chosen
+            ])
+            amounts.extend(
+                IngredientAmount(
+                    recipe_id=variant.pk, ingredient_id=ingredient_id,
+                    amount=100
+                )
+                for ingredient_id in chosen
+            )
+        IngredientAmount.objects.bulk_create(amounts)
+        return {variant.original_id: variant.pk for variant in variants}
+
+    def run(self):
+        limit = settings.SIMILAR_RECIPES_LIMIT
+        indexed, exact, found = [], [], 0
+        for recipe_id, variant_id in self.variants.items():
+            started = time.perf_counter()
+            result = similar_recipe_ids(recipe_id, limit)
+            indexed.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            exact_similar_recipe_ids(recipe_id, limit)
+            exact.append((time.perf_counter() - started) * 1000)
+            found += variant_id in result
+        return {
+            'samples': len(self.variants),
+            'limit': limit,
+            'bands': settings.SIMILAR_RECIPES_BANDS,
+            'rows': settings.SIMILAR_RECIPES_ROWS,
+            'candidates': settings.SIMILAR_RECIPES_CANDIDATES,
+            'rebuild_s': round(self.rebuild_seconds, 2),
+            # Доля рецептов, для которых найден их вариант
+            # с одним замененным ингредиентом.
+            'recall': round(found / len(self.variants), 3),
+            'index': self.summary(indexed),
+            'exact': self.summary(exact),
+        }
+
+    def summary(self, timings):
+        result = {'mean_ms': round(sum(timings) / len(timings), 2)}
+        for percent in PERCENTILES:
+            result[f'p{percent}_ms'] = round(percentile(timings, percent), 2)
+        return result
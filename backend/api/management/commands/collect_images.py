@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import VARIANTS_DIR
+from recipes.models import DetachedFile, Recipe
+
+IMAGE_DIRS = (Recipe._meta.get_field('image').upload_to, VARIANTS_DIR)
+
+
+def referenced_files():
+    """Возвращает пути ко всем файлам, на которые ссылаются рецепты."""
+    referenced = set()
+    for image, variants in Recipe.objects.values_list(
+        'image', 'image_variants'
+    ).iterator():
+        referenced.add(image)
+        referenced.update(variants.values())
+    return referenced
+
+
+class Command(BaseCommand):
+    """Удаляет файлы картинок, на которые больше не ссылаются рецепты."""
+
+    help = 'Удаляет неиспользуемые файлы картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-period', type=int,
+            default=settings.DETACHED_FILES_GRACE_PERIOD,
+            help='Не трогать файлы, измененные менее чем столько секунд назад.'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Проверить все файлы в каталогах картинок, а не только '
+                 'открепленные.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.'
+        )
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(
+            seconds=options['grace_period']
+        )
+        detached = DetachedFile.objects.filter(detached_at__lt=threshold)
+        candidates = set(detached.values_list('name', flat=True))
+        if options['full']:
+            candidates.update(self.stored_files())
+        referenced = referenced_files()
+        resolved = candidates & referenced
+        deleted = freed = 0
+        for name in sorted(candidates - referenced):
+            if not default_storage.exists(name):
+                resolved.add(name)
+                continue
+            if default_storage.get_modified_time(name) >= threshold:
+                continue
+            size = default_storage.size(name)
+            if not options['dry_run']:
+                default_storage.delete(name)
+            resolved.add(name)
+            deleted += 1
+            freed += size
+        if not options['dry_run']:
+            detached.filter(name__in=resolved).delete()
+        self.stdout.write(
+            f'Удалено файлов: {deleted}, освобождено байт: {freed}.'
+        )
+
+    def stored_files(self):
+        """Перечисляет файлы в каталогах картинок рецептов."""
+        for directory in IMAGE_DIRS:
+            if not default_storage.exists(directory):
+                continue
+            for name in default_storage.listdir(directory)[1]:
+                yield directory.rstrip('/') + '/' + name
@@ -0,0 +1,338 @@
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from PIL import Image
+
+from api.caching import bump_cache_version
+from recipes.images import generate_image_variants
+from recipes.models import (Favourites, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag, User)
+from users.models import Follow
+
+FIRST_NAMES = ['Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена',
+               'Дмитрий', 'Наталья', 'Алексей']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+              'Соколов', 'Михайлов', 'Новиков', 'Фёдоров', 'Морозов']
+DISHES = ['Суп', 'Салат', 'Пирог', 'Рагу', 'Омлет', 'Каша', 'Запеканка',
+          'Паста', 'Плов', 'Блины']
+ADJECTIVES = ['домашний', 'острый', 'летний', 'сытный', 'быстрый',
+              'праздничный', 'овощной', 'бабушкин', 'простой', 'пряный']
+PHRASES = ['Нарезать ингредиенты.', 'Смешать все в миске.',
+           'Довести до кипения.', 'Готовить на среднем огне.',
+           'Дать настояться.', 'Подавать горячим.', 'Посолить по вкусу.',
+           'Выложить в форму.', 'Запекать до румяной корочки.']
+DEFAULT_TAGS = [
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+]
+PLACEHOLDER_COLORS = ['#E26C2D', '#49B64E', '#8775D2', '#D2B48C',
+                      '#4682B4', '#CD5C5C', '#9ACD32', '#FFD700']
+
+_context = {}
+
+
+def power_law(count, exponent):
+    """Накопленные веса, убывающие как 1 / rank ** exponent."""
+    return list(accumulate(
+        1 / (rank + 1) ** exponent for rank in range(count)
+    ))
+
+
+def sample_distinct(rng, population, cum_weights, count, exclude=None):
+    """Выбирает до count разных элементов с учетом весов."""
+    chosen = set()
+    for _ in range(10):
+        if len(chosen) >= count:
+            break
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen)
+        ))
+        chosen.discard(exclude)
+    return list(chosen)[:count]
+
+
+def create_placeholders(count):
+    """Сохраняет картинки-заглушки и их уменьшенные копии."""
+    placeholders = []
+    field = Recipe._meta.get_field('image')
+    for index in range(count):
+        buffer = BytesIO()
+        Image.new(
+            'RGB', (960, 640),
+            PLACEHOLDER_COLORS[index % len(PLACEHOLDER_COLORS)]
+        ).save(buffer, 'JPEG')
+        name = default_storage.save(
+            field.generate_filename(None, f'placeholder_{index}.jpg'),
+            ContentFile(buffer.getvalue())
+        )
+        placeholders.append(
+            (name, generate_image_variants(Recipe(image=name)))
+        )
+    return placeholders
+
+
+def fetch_ids(objects, queryset, field):
+    """Проставляет первичные ключи объектам после bulk_create.
+
+    Нужно для баз, которые не возвращают ключи вставленных строк.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return
+    ids = dict(queryset.filter(
+        **{f'{field}__in': [getattr(obj, field) for obj in objects]}
+    ).values_list(field, 'pk'))
+    for obj in objects:
+        obj.pk = ids[getattr(obj, field)]
+
+
+def create_recipes(chunk):
+    """Создает пачку рецептов с ингредиентами и тегами.
+
+    Пачка генерируется своим генератором случайных чисел,
+    поэтому ее содержимое не зависит от количества процессов.
+    """
+    context = _context
+    start, stop = chunk
+    rng = random.Random(f'{context["seed"]}:recipes:{start}')
+    recipes = []
+    for index in range(start, stop):
+        image, variants = rng.choice(context['placeholders'])
+        recipes.append(Recipe(
+            author_id=rng.choices(
+                context['author_ids'], cum_weights=context['author_weights']
+            )[0],
+            name=(f'{rng.choice(DISHES)} {rng.choice(ADJECTIVES)} '
+                  f'{context["token"]}-{index}'),
+            text=' '.join(rng.choices(PHRASES, k=rng.randint(3, 8))),
+            cooking_time=rng.randint(5, 180),
+            image=image,
+            image_variants=variants,
+        ))
+    Recipe.objects.bulk_create(recipes)
+    fetch_ids(recipes, Recipe.objects.filter(pk__gt=context['last_id']),
+              'name')
+    for recipe in recipes:
+        recipe.pub_date = recipe.updated_at = context['now'] - timedelta(
+            seconds=rng.randint(0, context['days'] * 86400)
+        )
+    Recipe.objects.bulk_update(recipes, ['pub_date', 'updated_at'])
+    IngredientAmount.objects.bulk_create(
+        IngredientAmount(
+            recipe_id=recipe.pk, ingredient_id=ingredient_id,
+            amount=rng.randint(1, 500)
+        )
+        for recipe in recipes
+        for ingredient_id in rng.sample(
+            context['ingredient_ids'],
+            min(rng.randint(*context['ingredients_per_recipe']),
+                len(context['ingredient_ids']))
+        )
+    )
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+        for recipe in recipes
+        for tag_id in rng.sample(
+            context['tag_ids'], rng.randint(1, len(context['tag_ids']))
+        )
+    )
+    return [recipe.pk for recipe in recipes]
+
+
+def init_worker(context):
+    """Готовит процесс к созданию рецептов."""
+    _context.update(context)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    """Заполняет базу синтетическими данными для нагрузочных тестов."""
+
+    help = ('Создает пользователей, рецепты, подписки, избранное '
+            'и списки покупок со случайными данными.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=[3, 10],
+            metavar=('MIN', 'MAX')
+        )
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Среднее количество подписок на пользователя.'
+        )
+        parser.add_argument(
+            '--favourites', type=int, default=20,
+            help='Среднее количество избранных рецептов на пользователя.'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=3,
+            help='Среднее количество рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.2,
+            help='Показатель степенного распределения популярности '
+                 'авторов и рецептов, 0 - равномерное.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты публикации.'
+        )
+        parser.add_argument('--placeholders', type=int, default=8)
+        parser.add_argument('--prefix', default='user')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Сколько процессов создают рецепты.'
+        )
+
+    def step(self, title, started):
+        self.stdout.write(f'{title}: {time.monotonic() - started:.1f} с.')
+        return time.monotonic()
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов, сначала выполните load_data.'
+            )
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        rng = random.Random(options['seed'])
+        started = time.monotonic()
+        user_ids = self.create_users(rng, options)
+        started = self.step(f'Пользователи ({len(user_ids)})', started)
+        recipe_ids = self.create_recipes(
+            user_ids, ingredient_ids, options
+        )
+        started = self.step(f'Рецепты ({len(recipe_ids)})', started)
+        self.create_relations(rng, user_ids, recipe_ids, options)
+        started = self.step('Подписки, избранное и покупки', started)
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        call_command('rebuild_similar_recipes', stdout=self.stdout)
+        bump_cache_version('recipes')
+        self.step('Счетчики, списки покупок, ленты и похожие рецепты', started)
+
+    def create_users(self, rng, options):
+        prefix = options['prefix']
+        # Номера продолжаются после наибольшего занятого, поэтому
+        # новые имена не совпадают с уже существующими.
+        first = max(
+            (
+                int(username[len(prefix):])
+                for username in User.objects.filter(
+                    username__startswith=prefix
+                ).values_list('username', flat=True).iterator()
+                if username[len(prefix):].isdigit()
+            ),
+            default=-1
+        ) + 1
+        password = make_password(options['password'])
+        user_ids = []
+        for start in range(0, options['users'], options['batch_size']):
+            users = [
+                User(
+                    username=f'{prefix}{index}',
+                    email=f'{prefix}{index}@example.com',
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    password=password,
+                )
+                for index in range(
+                    first + start,
+                    first + min(start + options['batch_size'],
+                                options['users'])
+                )
+            ]
+            User.objects.bulk_create(users)
+            fetch_ids(users, User.objects.all(), 'username')
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def create_recipes(self, user_ids, ingredient_ids, options):
+        if not user_ids or not options['recipes']:
+            return []
+        context = {
+            'seed': options['seed'],
+            'token': f'{options["prefix"]}{options["seed"]}',
+            'author_ids': user_ids,
+            'author_weights': power_law(len(user_ids), options['exponent']),
+            'ingredient_ids': ingredient_ids,
+            'ingredients_per_recipe': options['ingredients_per_recipe'],
+            'tag_ids': list(Tag.objects.values_list('pk', flat=True)),
+            'placeholders': create_placeholders(options['placeholders']),
+            'last_id': Recipe.objects.order_by('-pk').values_list(
+                'pk', flat=True
+            ).first() or 0,
+            'now': timezone.now(),
+            'days': options['days'],
+        }
+        chunks = [
+            (start, min(start + options['batch_size'], options['recipes']))
+            for start in range(0, options['recipes'], options['batch_size'])
+        ]
+        if options['processes'] > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(
+                options['processes'],
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=init_worker, initargs=(context,)
+            ) as executor:
+                results = list(executor.map(create_recipes, chunks))
+        else:
+            _context.update(context)
+            results = [create_recipes(chunk) for chunk in chunks]
+        return [pk for chunk_ids in results for pk in chunk_ids]
+
+    def create_relations(self, rng, user_ids, recipe_ids, options):
+        author_weights = power_law(len(user_ids), options['exponent'])
+        popular_recipes = recipe_ids[:]
+        rng.shuffle(popular_recipes)
+        recipe_weights = power_law(len(recipe_ids), options['exponent'])
+        relations = (
+            (Follow, 'following_id', user_ids, author_weights,
+             options['follows']),
+            (Favourites, 'recipe_id', popular_recipes, recipe_weights,
+             options['favourites']),
+            (ShoppingCart, 'recipe_id', popular_recipes, recipe_weights,
+             options['cart']),
+        )
+        for model, field, population, weights, average in relations:
+            if not population or not average:
+                continue
+            objects = []
+            for user_id in user_ids:
+                count = min(rng.randint(0, 2 * average), len(population) - 1)
+                objects.extend(
+                    model(user_id=user_id, **{field: target})
+                    for target in sample_distinct(
+                        rng, population, weights, count, exclude=user_id
+                        if model is Follow else None
+                    )
+                )
+                if len(objects) >= options['batch_size']:
+                    model.objects.bulk_create(objects)
+                    objects = []
+            model.objects.bulk_create(objects)
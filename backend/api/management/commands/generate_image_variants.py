@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import run_in_worker
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Создает уменьшенные копии картинок существующих рецептов."""
+
+    help = 'Создает уменьшенные копии картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_WORKERS,
+            help='Количество потоков обработки.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only(
+            'pk', 'image', 'image_variants'
+        ).order_by('pk')
+        recipe_ids = [
+            recipe.pk for recipe in recipes.iterator()
+            if options['force'] or recipe.image_variants_outdated
+        ]
+        force = [options['force']] * len(recipe_ids)
+        with ThreadPoolExecutor(max(options['workers'], 1)) as executor:
+            results = list(executor.map(run_in_worker, recipe_ids, force))
+        self.stdout.write(
+            f'Обработано рецептов: {sum(results)} из {len(recipe_ids)}.'
+        )
@@ -1,45 +1,129 @@
+import json
+import time
+from argparse import ArgumentTypeError
 from csv import DictReader
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
 
-csv_files = [
-    {'model': Ingredient, 'filename': 'ingredients.csv',
-     'fieldnames': ['name', 'measurement_unit']},
-]
+from api.caching import bump_cache_version
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient, Recipe
+
+FIELDNAMES = ['name', 'measurement_unit']
+DEFAULT_PATH = 'static/data/ingredients.csv'
+
+
+def read_csv(path):
+    """Построчно читает ингредиенты из файла csv без заголовка."""
+    with open(path, encoding='utf-8', newline='') as csvfile:
+        yield from DictReader(csvfile, fieldnames=FIELDNAMES)
+
+
+def read_json(path):
+    """Читает ингредиенты из файла json со списком объектов."""
+    with open(path, encoding='utf-8') as jsonfile:
+        yield from json.load(jsonfile)
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+def positive_int(value):
+    """Тип аргумента: целое число больше нуля."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f'{value!r} не целое число.')
+    if number <= 0:
+        raise ArgumentTypeError('Значение должно быть больше нуля.')
+    return number
+
+
+def batches(items, size):
+    """Разбивает последовательность на списки длиной size."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
 class Command(BaseCommand):
-    """Загружает ингредиенты из файла csv."""
-
-    def csv_loader(self, cf):
-        csv_file = 'static/data/ingredients.csv'
-        with open(csv_file, encoding='utf-8', newline='') as csvfile:
-            reader = DictReader(csvfile, fieldnames=cf['fieldnames'])
-            print(f'Загрузка в таблицу модели {cf["model"].__name__}')
-
-            i, err, r = 0, 0, 0
-
-            for row in reader:
-                try:
-                    cf['model'].objects.update_or_create(
-                        name=row['name'], defaults=row
-                    )
-                    r += 1
-                except Exception as error:
-                    print(row)
-                    print(
-                        f'Ошибка записи в таблицу модели '
-                        f'{cf["model"].__name__}, '
-                        f'{str(error)}')
-                    err += 1
-                i += 1
-            print(
-                f'Всего: {i} строк. Загружено: {r} строк. '
-                f'Ошибки: {err} строк.')
+    """Загружает ингредиенты из файла csv или json."""
+
+    help = 'Загружает или обновляет ингредиенты из файла csv или json.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='Путь к файлу с ингредиентами (.csv или .json).'
+        )
+        parser.add_argument(
+            '--batch-size', type=positive_int, default=1000,
+            help='Сколько ингредиентов записывать за один запрос.'
+        )
+
+    def read(self, path):
+        """Читает файл и убирает повторы, оставляя последнюю запись."""
+        reader = READERS.get(Path(path).suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        units = {}
+        try:
+            for row in reader(path):
+                name = (row.get('name') or '').strip()
+                unit = (row.get('measurement_unit') or '').strip()
+                if name and unit:
+                    units[name] = unit
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        return units
+
+    def upsert(self, units):
+        """Создает новые ингредиенты и обновляет единицы измерения."""
+        existing = set()
+        changed = []
+        for ingredient in Ingredient.objects.filter(name__in=units):
+            existing.add(ingredient.name)
+            if ingredient.measurement_unit != units[ingredient.name]:
+                ingredient.measurement_unit = units[ingredient.name]
+                changed.append(ingredient)
+        Ingredient.objects.bulk_update(changed, ['measurement_unit'])
+        if changed:
+            # bulk_update не отправляет сигналы, поэтому рецепты с этими
+            # ингредиентами отмечаются измененными здесь: от времени
+            # изменения зависят ETag и Last-Modified ответов.
+            Recipe.objects.filter(
+                ingredient_amount__ingredient__in=changed
+            ).update(updated_at=timezone.now())
+        created = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in units.items() if name not in existing
+        )
+        return len(created), len(changed)
+
+    @transaction.atomic
+    def load(self, units, batch_size):
+        """Записывает ингредиенты пачками в одной транзакции."""
+        created = updated = 0
+        for batch in batches(units.items(), batch_size):
+            batch_created, batch_updated = self.upsert(dict(batch))
+            created += batch_created
+            updated += batch_updated
+        return created, updated
 
     def handle(self, *args, **options):
-        print("Идет загрузка данных...")
-        for сf in csv_files:
-            self.csv_loader(сf)
-        print('Загрука завершена.')
+        started = time.monotonic()
+        units = self.read(options['path'])
+        created, updated = self.load(units, options['batch_size'])
+        bump_cache_version('ingredients')
+        bump_cache_version('recipes')
+        ingredient_index.invalidate()
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Всего: {len(units)} ингредиентов. Создано: {created}. '
+            f'Обновлено: {updated}. '
+            f'Скорость: {len(units) / max(elapsed, 1e-6):.0f} строк/с.'
+        )
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Пересчитывает суммарные списки покупок по рецептам в корзинах."""
+
+    help = 'Пересчитывает или проверяет суммарные списки покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только проверить списки покупок, ничего не меняя.'
+        )
+
+    def verify(self):
+        expected = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.aggregated().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        wrong = [
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        ]
+        if wrong:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(wrong)}. '
+                f'Запустите команду без --verify, чтобы пересчитать их.'
+            )
+        self.stdout.write(f'Списки покупок актуальны: {len(stored)} строк.')
+
+    @transaction.atomic
+    def rebuild(self):
+        ShoppingListItem.objects.all().delete()
+        items = (
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.aggregated().iterator()
+        )
+        created = ShoppingListItem.objects.bulk_create(
+            items, batch_size=BATCH_SIZE
+        )
+        self.stdout.write(f'Списки покупок пересчитаны: {len(created)} строк.')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild()
@@ -0,0 +1,46 @@
+import time
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import IngredientAmount, SimilarityBucket
+from recipes.similarity import band_buckets
+
+
+class Command(BaseCommand):
+    """Пересчитывает корзины LSH для поиска похожих рецептов."""
+
+    help = ('Пересчитывает индекс похожих рецептов, например после '
+            'изменения SIMILAR_RECIPES_BANDS или SIMILAR_RECIPES_ROWS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        SimilarityBucket.objects.all().delete()
+        rows = IngredientAmount.objects.order_by(
+            'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id').iterator()
+        recipes = 0
+        buckets = []
+        for recipe_id, group in groupby(rows, key=itemgetter(0)):
+            recipes += 1
+            buckets.extend(
+                SimilarityBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+                for band, bucket in band_buckets(
+                    [ingredient_id for _, ingredient_id in group]
+                ).items()
+            )
+            if len(buckets) >= options['batch_size']:
+                SimilarityBucket.objects.bulk_create(buckets)
+                buckets = []
+        SimilarityBucket.objects.bulk_create(buckets)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Индекс похожих рецептов пересчитан: {recipes} рецептов '
+            f'за {elapsed:.1f} с ({recipes / max(elapsed, 1e-9):.0f} в с).'
+        )
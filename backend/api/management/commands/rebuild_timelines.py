@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Follow, UserCounters
+
+
+class Command(BaseCommand):
+    """Заполняет ленты подписчиков заново по подпискам и рецептам."""
+
+    help = ('Пересобирает ленты рецептов: последние FEED_BACKFILL_LIMIT '
+            'рецептов каждого автора для всех его подписчиков.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        TimelineEntry.objects.all().delete()
+        follows = Follow.objects.exclude(
+            following__counters__followers_count__gt=(
+                settings.FEED_FANOUT_LIMIT
+            )
+        )
+        followers = {}
+        for user_id, author_id in follows.values_list(
+            'user_id', 'following_id'
+        ).iterator():
+            followers.setdefault(author_id, []).append(user_id)
+        recipes = Recipe.objects.latest_per_author(
+            follows.values('following_id'), settings.FEED_BACKFILL_LIMIT
+        ).order_by().values_list('pk', 'author_id', 'pub_date')
+        created = TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date
+                )
+                for recipe_id, author_id, pub_date in recipes.iterator()
+                for user_id in followers[author_id]
+            ),
+            batch_size=settings.FEED_BATCH_SIZE
+        )
+        # Ленты подписчиков популярных авторов заполнятся всеми их
+        # рецептами, когда подписчиков станет не больше FEED_FANOUT_LIMIT.
+        UserCounters.objects.filter(
+            followers_count__lte=settings.FEED_FANOUT_LIMIT
+        ).update(popular_since=None)
+        UserCounters.objects.filter(
+            followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).update(popular_since=models.Subquery(
+            Recipe.objects.filter(
+                author_id=models.OuterRef('user_id')
+            ).order_by('pub_date').values('pub_date')[:1]
+        ))
+        self.stdout.write(f'Ленты пересобраны: {len(created)} записей.')
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favourites, Recipe, ShoppingCart, User
+from users.models import Follow, UserCounters
+
+
+def count_subquery(model, field):
+    """Подзапрос, считающий строки model, ссылающиеся на объект."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ), 0
+    )
+
+
+COUNTERS = (
+    (Recipe, 'favourites_count', Favourites, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (UserCounters, 'recipes_count', Recipe, 'author'),
+    (UserCounters, 'followers_count', Follow, 'following'),
+)
+
+
+class Command(BaseCommand):
+    """Сверяет счетчики с реальным количеством записей и исправляет их."""
+
+    help = 'Исправляет расхождения в счетчиках рецептов и пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя.'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        missing = User.objects.filter(counters__isnull=True)
+        if options['dry_run']:
+            self.stdout.write(
+                f'Пользователей без счетчиков: {missing.count()}.'
+            )
+        else:
+            created = UserCounters.objects.bulk_create(
+                (
+                    UserCounters(user_id=user_id)
+                    for user_id in missing.values_list('pk', flat=True)
+                ),
+                batch_size=1000
+            )
+            self.stdout.write(f'Созданы счетчики: {len(created)}.')
+        for model, field, counted_model, counted_field in COUNTERS:
+            actual = count_subquery(counted_model, counted_field)
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{field: F('actual')}
+            )
+            if options['dry_run']:
+                fixed = drifted.count()
+            else:
+                fixed = model.objects.filter(
+                    pk__in=drifted.values('pk')
+                ).update(**{field: actual})
+            self.stdout.write(
+                f'{model.__name__}.{field}: расхождений {fixed}.'
+            )
@@ -0,0 +1,342 @@
+import atexit
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from .caching import get_cache_stats
+
+UNMATCHED_ENDPOINT = 'unmatched'
+AGGREGATE_FILE = 'aggregate.json'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CACHE_NAMESPACES = ('recipes', 'tags', 'ingredients')
+METRICS = {
+    'foodgram_http_requests_total': (
+        'counter', 'Количество запросов по действиям и статусам.'
+    ),
+    'foodgram_http_request_errors_total': (
+        'counter', 'Количество ответов с ошибкой сервера.'
+    ),
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.'
+    ),
+    'foodgram_db_queries_total': (
+        'counter', 'Количество SQL-запросов.'
+    ),
+    'foodgram_db_query_duration_seconds_total': (
+        'counter', 'Суммарное время SQL-запросов.'
+    ),
+    'foodgram_db_connections_created_total': (
+        'counter', 'Сколько раз открывалось соединение с базой.'
+    ),
+    'foodgram_response_cache_hits_total': (
+        'counter', 'Ответы, отданные из кэша.'
+    ),
+    'foodgram_response_cache_misses_total': (
+        'counter', 'Ответы, которых не было в кэше.'
+    ),
+    'foodgram_response_cache_hit_ratio': (
+        'gauge', 'Доля ответов, отданных из кэша.'
+    ),
+}
+
+
+def labels_key(labels):
+    """Ключ серии метрики по ее меткам."""
+    return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+def format_labels(key, **extra):
+    """Метки серии в формате Prometheus."""
+    labels = [*json.loads(key), *extra.items()]
+    if not labels:
+        return ''
+    values = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"'
+        ).replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + values + '}'
+
+
+def empty_metrics():
+    return {'counters': {}, 'histograms': {}}
+
+
+def read_metrics(path):
+    """Метрики из файла или None, если файл не прочитать."""
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_metrics(path, data):
+    """Атомарно записывает метрики в формате json в файл."""
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(data)
+    os.replace(temporary, path)
+
+
+def merge_metrics(total, data):
+    """Прибавляет метрики data к total."""
+    for name, series in data['counters'].items():
+        merged = total['counters'].setdefault(name, {})
+        for key, value in series.items():
+            merged[key] = merged.get(key, 0) + value
+    for name, series in data['histograms'].items():
+        merged = total['histograms'].setdefault(name, {})
+        for key, histogram in series.items():
+            result = merged.setdefault(key, {
+                'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0, 'count': 0
+            })
+            for index, count in enumerate(histogram['buckets']):
+                result['buckets'][index] += count
+            result['sum'] += histogram['sum']
+            result['count'] += histogram['count']
+    return total
+
+
+@contextmanager
+def locked(directory, operation):
+    """Блокирует каталог метрик на время чтения или слияния файлов."""
+    with open(directory / 'metrics.lock', 'a') as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge_stale_files(directory, pid):
+    """Переносит метрики завершившихся процессов в общий файл.
+
+    Файл с pid текущего процесса остался от завершившегося процесса
+    с тем же pid: текущий процесс еще ничего не записывал.
+    """
+    with locked(directory, fcntl.LOCK_EX):
+        stale = [
+            path for path in directory.glob('*.json')
+            if path.stem.isdigit() and (
+                int(path.stem) == pid or not is_alive(int(path.stem))
+            )
+        ]
+        if not stale:
+            return
+        path = directory / AGGREGATE_FILE
+        total = read_metrics(path) or empty_metrics()
+        for stale_path in stale:
+            data = read_metrics(stale_path)
+            if data is not None:
+                merge_metrics(total, data)
+        write_metrics(path, json.dumps(total))
+        for stale_path in stale:
+            stale_path.unlink(missing_ok=True)
+
+
+class MetricsStore:
+    """Метрики текущего процесса.
+
+    Каждый процесс периодически записывает свои метрики в отдельный
+    файл в METRICS_DIR, а эндпоинт метрик суммирует все файлы,
+    поэтому данные видны по всем воркерам gunicorn. При первой записи
+    процесс переносит файлы завершившихся воркеров в общий файл.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed_at = 0
+        self.merged = False
+
+    def check_fork(self):
+        """Не досчитывает метрики родителя в дочернем процессе."""
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.check_fork()
+            series = self.counters.setdefault(name, {})
+            key = labels_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self.check_fork()
+            series = self.histograms.setdefault(name, {})
+            histogram = series.setdefault(labels_key(labels), {
+                'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0, 'count': 0
+            })
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def observe_request(self, metrics):
+        """Учитывает запрос по замерам RequestTimingMiddleware."""
+        labels = {'endpoint': metrics['endpoint']}
+        self.inc('foodgram_http_requests_total', {
+            **labels, 'method': metrics['method'],
+            'status': metrics['status'],
+        })
+        if metrics['status'] >= 500:
+            self.inc('foodgram_http_request_errors_total', labels)
+        self.observe(
+            'foodgram_http_request_duration_seconds', labels,
+            metrics['total_ms'] / 1000
+        )
+        self.inc('foodgram_db_queries_total', labels, metrics['queries'])
+        self.inc(
+            'foodgram_db_query_duration_seconds_total', labels,
+            metrics['db_ms'] / 1000
+        )
+        self.flush()
+
+    def flush(self, force=False):
+        """Записывает метрики процесса в файл не чаще раза в интервал."""
+        now = time.monotonic()
+        with self.lock:
+            self.check_fork()
+            if not force and (
+                now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL
+            ):
+                return
+            self.flushed_at = now
+            data = json.dumps({
+                'counters': self.counters, 'histograms': self.histograms
+            })
+            merge, self.merged = not self.merged, True
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        if merge:
+            merge_stale_files(directory, self.pid)
+        write_metrics(directory / f'{self.pid}.json', data)
+
+
+store = MetricsStore()
+atexit.register(store.flush, force=True)
+
+
+def collect():
+    """Суммирует метрики всех процессов из METRICS_DIR."""
+    store.flush(force=True)
+    directory = Path(settings.METRICS_DIR)
+    total = empty_metrics()
+    with locked(directory, fcntl.LOCK_SH):
+        for path in directory.glob('*.json'):
+            data = read_metrics(path)
+            if data is not None:
+                merge_metrics(total, data)
+    return total['counters'], total['histograms']
+
+
+def render_metrics():
+    """Возвращает метрики в текстовом формате Prometheus."""
+    counters, histograms = collect()
+    gauges = {}
+    for namespace in CACHE_NAMESPACES:
+        stats = get_cache_stats(namespace)
+        key = labels_key({'namespace': namespace})
+        counters.setdefault(
+            'foodgram_response_cache_hits_total', {}
+        )[key] = stats['hits']
+        counters.setdefault(
+            'foodgram_response_cache_misses_total', {}
+        )[key] = stats['misses']
+        total = stats['hits'] + stats['misses']
+        gauges.setdefault('foodgram_response_cache_hit_ratio', {})[key] = (
+            stats['hits'] / total if total else 0
+        )
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            for key, histogram in histograms.get(name, {}).items():
+                for bound, count in zip(
+                    LATENCY_BUCKETS, histogram['buckets']
+                ):
+                    lines.append(
+                        f'{name}_bucket{format_labels(key, le=bound)} {count}'
+                    )
+                lines.append(
+                    f'{name}_bucket{format_labels(key, le="+Inf")} '
+                    f'{histogram["count"]}'
+                )
+                lines.append(
+                    f'{name}_sum{format_labels(key)} {histogram["sum"]}'
+                )
+                lines.append(
+                    f'{name}_count{format_labels(key)} {histogram["count"]}'
+                )
+            continue
+        series = (gauges if kind == 'gauge' else counters).get(name, {})
+        for key, value in series.items():
+            lines.append(f'{name}{format_labels(key)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Отдает метрики для Prometheus.
+
+    Доступ - по заголовку Authorization: Bearer METRICS_TOKEN,
+    а если токен не задан - только с адресов METRICS_ALLOWED_IPS.
+    """
+    if settings.METRICS_TOKEN:
+        allowed = request.headers.get('Authorization') == (
+            f'Bearer {settings.METRICS_TOKEN}'
+        )
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in (
+            settings.METRICS_ALLOWED_IPS
+        )
+    if not allowed:
+        raise Http404
+    return HttpResponse(
+        render_metrics(), content_type='text/plain; version=0.0.4'
+    )
+
+
+class MetricsMiddleware:
+    """Учитывает запросы в метриках.
+
+    Должен стоять в MIDDLEWARE перед RequestTimingMiddleware,
+    замеры которого он использует.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        timing = getattr(request, 'timing', {})
+        metrics = timing.get('metrics')
+        if metrics is not None:
+            # У запросов без маршрута метка не зависит от пути,
+            # иначе каждый новый адрес создавал бы свои серии.
+            store.observe_request({
+                **metrics,
+                'endpoint': timing['endpoint'] or UNMATCHED_ENDPOINT
+            })
+        return response
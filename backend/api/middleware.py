@@ -0,0 +1,163 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.requests')
+
+
+class QueryTracker:
+    """Считает SQL-запросы запроса и время их выполнения."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def max_duplicates(self):
+        """Сколько раз выполнен самый частый одинаковый запрос."""
+        return max(self.statements.values(), default=0)
+
+
+def get_endpoint(view_func, method):
+    """Возвращает название вьюсета и действия, например RecipeViewSet.list."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower())
+    if action is None:
+        return view_class.__name__
+    return f'{view_class.__name__}.{action}'
+
+
+def milliseconds(start, end):
+    """Длительность между отметками perf_counter в миллисекундах."""
+    if start is None or end is None:
+        return 0.0
+    return round((end - start) * 1000, 2)
+
+
+@contextmanager
+def serialization_timer(request):
+    """Прибавляет время блока к времени сериализации запроса.
+
+    Вложенные сериализаторы выполняются внутри блока внешнего
+    и отдельно не учитываются.
+    """
+    timing = getattr(request, 'timing', None)
+    if timing is None or timing.get('serializing'):
+        yield
+        return
+    timing['serializing'] = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing['serializing'] = False
+        timing['serialize'] = (
+            timing.get('serialize', 0.0) + time.perf_counter() - started
+        )
+
+
+class RequestTimingMiddleware:
+    """Замеряет SQL-запросы, время представления и рендеринга ответа.
+
+    Время сериализации объектов в данные ответа входит в время
+    представления и дополнительно выводится отдельно как serialize.
+    render - только преобразование готовых данных в JSON.
+    Результаты отдаются в заголовке Server-Timing и пишутся в лог
+    api.requests одной строкой json. Запросы, превысившие пороги
+    по количеству запросов, повторам одного запроса или времени,
+    пишутся с уровнем WARNING как вероятные N+1.
+    Запросы, выполненные при отдаче потокового ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracker = QueryTracker()
+        request.timing = {'endpoint': None}
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(tracker)
+                )
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        timing = request.timing
+        view_finished = timing.get('view_finished', finished)
+        metrics = {
+            'endpoint': timing['endpoint'] or request.path,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': tracker.count,
+            'duplicate_queries': tracker.max_duplicates,
+            'db_ms': round(tracker.duration * 1000, 2),
+            'view_ms': milliseconds(timing.get('view_started'),
+                                    view_finished),
+            'serialize_ms': round(timing.get('serialize', 0.0) * 1000, 2),
+            'render_ms': milliseconds(view_finished,
+                                      timing.get('render_finished')),
+            'total_ms': milliseconds(started, finished),
+        }
+        timing['metrics'] = metrics
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={metrics["db_ms"]};desc="{tracker.count} queries", '
+                f'view;dur={metrics["view_ms"]}, '
+                f'serialize;dur={metrics["serialize_ms"]}, '
+                f'render;dur={metrics["render_ms"]}, '
+                f'total;dur={metrics["total_ms"]}'
+            )
+        self.log(metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timing['endpoint'] = get_endpoint(view_func, request.method)
+        request.timing['view_started'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = request.timing
+        timing['view_finished'] = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: timing.update(render_finished=time.perf_counter())
+        )
+        return response
+
+    def log(self, metrics):
+        suspicious = [
+            reason for reason, exceeded in (
+                ('queries',
+                 metrics['queries'] > settings.REQUEST_QUERY_THRESHOLD),
+                ('duplicate_queries',
+                 metrics['duplicate_queries']
+                 >= settings.REQUEST_DUPLICATE_QUERY_THRESHOLD),
+                ('latency',
+                 metrics['total_ms'] > settings.REQUEST_LATENCY_THRESHOLD),
+            ) if exceeded
+        ]
+        if suspicious:
+            logger.warning(json.dumps(
+                {**metrics, 'suspected_n_plus_one': suspicious},
+                ensure_ascii=False
+            ))
+        else:
+            logger.info(json.dumps(metrics, ensure_ascii=False))
@@ -0,0 +1,187 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.http import HttpResponse
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_MODES = ('1', 'true', 'inline')
+
+
+class QueryLog:
+    """Запоминает SQL-запросы с параметрами и временем выполнения."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'duration_ms': round(
+                    (time.perf_counter() - started) * 1000, 3
+                ),
+            })
+
+
+def explain(query):
+    """Возвращает план выполнения SELECT-запроса."""
+    connection = connections[query['alias']]
+    try:
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {query["sql"]}', query['params'])
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
+    except DatabaseError as error:
+        return f'EXPLAIN не выполнен: {error}'
+
+
+def printable_params(query):
+    """Параметры запроса в виде, пригодном для json."""
+    if query['many']:
+        return None
+    return [str(param) for param in query['params'] or ()]
+
+
+def get_staff_user(request):
+    """Возвращает пользователя запроса, если он из персонала."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            user, _ = TokenAuthentication().authenticate(request) or (
+                None, None
+            )
+        except AuthenticationFailed:
+            return None
+    if user is not None and user.is_staff:
+        return user
+    return None
+
+
+class ProfilingMiddleware:
+    """Профилирует запросы персонала по запросу.
+
+    Включается настройкой PROFILING_ENABLED. Запрос с заголовком
+    X-Profile или параметром profile со значением 1, true или inline
+    выполняется под cProfile, все его SQL-запросы записываются вместе
+    с планами EXPLAIN, другие значения не учитываются.
+    Профиль (.prof) и отчет (.json) сохраняются в PROFILING_DIR,
+    их имя возвращается в заголовке X-Profile. При значении inline
+    вместо ответа возвращается текстовый отчет.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = (request.headers.get(PROFILE_HEADER) or request.GET.get(
+            PROFILE_QUERY_PARAM
+        ) or '').strip().lower()
+        if mode not in PROFILE_MODES or get_staff_user(request) is None:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        query_log = QueryLog()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(query_log)
+                )
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+                if response.streaming:
+                    content = b''.join(response.streaming_content)
+                    response.streaming_content = [content]
+            finally:
+                profiler.disable()
+        report = self.build_report(
+            request, response, query_log.queries,
+            round((time.perf_counter() - started) * 1000, 2)
+        )
+        profile_id = self.save(profiler, report)
+        if mode == 'inline':
+            response = HttpResponse(
+                self.render_text(profiler, report),
+                content_type='text/plain; charset=utf-8'
+            )
+        response[PROFILE_HEADER] = profile_id
+        return response
+
+    def build_report(self, request, response, queries, total_ms):
+        slowest = sorted(
+            (
+                query for query in queries
+                if not query['many']
+                and query['sql'].lstrip().upper().startswith('SELECT')
+            ),
+            key=lambda query: query['duration_ms'], reverse=True
+        )[:settings.PROFILING_EXPLAIN_LIMIT]
+        for query in slowest:
+            query['plan'] = explain(query)
+        return {
+            'endpoint': getattr(request, 'timing', {}).get('endpoint'),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': total_ms,
+            'queries': [
+                {**query, 'params': printable_params(query)}
+                for query in queries
+            ],
+        }
+
+    def save(self, profiler, report):
+        """Сохраняет профиль и отчет, возвращает их общее имя."""
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid4().hex[:8]}'
+        profiler.dump_stats(directory / f'{profile_id}.prof')
+        (directory / f'{profile_id}.json').write_text(
+            json.dumps(report, ensure_ascii=False, indent=2),
+            encoding='utf-8'
+        )
+        return profile_id
+
+    def render_text(self, profiler, report):
+        output = io.StringIO()
+        output.write(
+            f'{report["method"]} {report["path"]} -> {report["status"]}, '
+            f'{report["total_ms"]} мс, SQL-запросов: '
+            f'{len(report["queries"])}\n\n'
+        )
+        pstats.Stats(profiler, stream=output).sort_stats(
+            'cumulative'
+        ).print_stats(40)
+        for number, query in enumerate(report['queries'], 1):
+            output.write(
+                f'\n#{number} [{query["duration_ms"]} мс] {query["sql"]}\n'
+                f'    params: {query["params"]}\n'
+            )
+            if 'plan' in query:
+                plan = query['plan'].replace('\n', '\n        ')
+                output.write(f'    plan:\n        {plan}\n')
+        return output.getvalue()
@@ -0,0 +1,25 @@
+import json
+
+from rest_framework import renderers
+
+
+class PlainTextRenderer(renderers.BaseRenderer):
+    """Рендерер для выгрузки файлов в текстовом виде.
+
+    Сами файлы отдаются потоком, рендерер нужен для выбора формата
+    и для вывода ошибок в выбранном формате.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """Рендерер для выгрузки файлов в формате csv."""
+    media_type = 'text/csv'
+    format = 'csv'
@@ -1,25 +1,45 @@
-from django.db.models import F
+from django.db import transaction
 from django.forms import ValidationError
 
 from rest_framework import serializers
 
 from recipes.models import (Favourites, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Tag, User)
-from users.models import Follow
+                            ShoppingCart, ShoppingListItem, Tag, User)
+from recipes.similarity import index_recipe
+from users.models import Follow, UserCounters
 
-from .extra_fields import Base64ImageField
-from .utils import ingredient_amount_set
+from .extra_fields import Base64ImageField, ImageVariantsField
+from .middleware import serialization_timer
+from .utils import (get_recipes_limit, ingredient_amount_set,
+                    ingredient_amount_update)
 
 
-class UserSerializer(serializers.ModelSerializer):
+def get_user_counter(user, field):
+    """Возвращает значение счетчика пользователя."""
+    try:
+        return getattr(user.counters, field)
+    except UserCounters.DoesNotExist:
+        return 0
+
+
+class TimedSerializerMixin:
+    """Учитывает время сериализации в замерах RequestTimingMiddleware."""
+
+    def to_representation(self, instance):
+        with serialization_timer(self.context.get('request')):
+            return super().to_representation(instance)
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для модели пользователей"""
 
     is_subscribed = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'password', 'is_subscribed')
-        read_only_fields = ['is_subscribed']
+                  'last_name', 'password', 'is_subscribed', 'followers_count')
+        read_only_fields = ['is_subscribed', 'followers_count']
         model = User
         extra_kwargs = {'password': {'write_only': True}}
 
@@ -30,13 +50,19 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, following):
         """Определяет подписан ли пользователь на данного автора."""
+        if hasattr(following, 'is_subscribed'):
+            return following.is_subscribed
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return Follow.objects.filter(user=user, following=following).exists()
 
+    def get_followers_count(self, user):
+        """Возвращает количество подписчиков пользователя."""
+        return get_user_counter(user, 'followers_count')
+
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для модели тегов."""
     class Meta:
         model = Tag
@@ -44,7 +70,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'name', 'color', 'slug']
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для модели ингредиентов."""
     class Meta:
         model = Ingredient
@@ -52,12 +78,14 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'name', 'measurement_unit']
 
 
-class FavouriteRecipeSerializer(serializers.ModelSerializer):
+class FavouriteRecipeSerializer(TimedSerializerMixin,
+                                serializers.ModelSerializer):
     """Сериализатор для избранных рецептов."""
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_variants', 'cooking_time']
         read_only_fields = ['id', 'name', 'image', 'cooking_time']
 
     def validate_favorite(self, data, user, recipe):
@@ -99,28 +127,48 @@ class FavouriteRecipeSerializer(serializers.ModelSerializer):
             return self.validate_shopping_cart(data, user, recipe)
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class IngredientAmountReadSerializer(serializers.ModelSerializer):
+    """Сериализатор для чтения ингредиентов рецепта с количеством."""
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = IngredientAmount
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class RecipeReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для чтения рецептов."""
     author = UserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        exclude = ['pub_date']
+        exclude = ['pub_date', 'search_vector']
 
     def get_ingredients(self, recipe):
         """Получает ингредиенты для рецепта."""
-        ingredients = recipe.ingredients.values(
-            'id', 'name', 'measurement_unit',
-            amount=F('ingredient_amount__amount')
-        )
-        return ingredients
+        return IngredientAmountReadSerializer(
+            recipe.ingredient_amount.all(), many=True
+        ).data
+
+    def to_representation(self, recipe):
+        """Передает автору признак подписки, вычисленный в запросе."""
+        if recipe.author and hasattr(recipe, 'is_author_subscribed'):
+            recipe.author.is_subscribed = recipe.is_author_subscribed
+        return super().to_representation(recipe)
 
     def get_is_favorited(self, recipe):
         """Определяет есть ли данный рецепт в избранном у пользователя."""
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -128,6 +176,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, recipe):
         """Определяет есть ли данный рецепт в списке покупок у пользователя."""
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -147,8 +197,7 @@ class IngredeintAmountSerializer(serializers.ModelSerializer):
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления и изменения рецептов."""
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredeintAmountSerializer(many=True)
     image = Base64ImageField()
 
@@ -172,61 +221,97 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             used_ingredients.add(ingredient['id'])
         if len(used_ingredients) != len(data):
             raise ValidationError('Ингредиенты повторяются.')
+        missing = used_ingredients - set(
+            Ingredient.objects.filter(
+                id__in=used_ingredients
+            ).values_list('id', flat=True)
+        )
+        if missing:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}.'
+            )
         return data
 
     def validate_tags(self, data):
         """Валидация тегов."""
-        tags_count = Tag.objects.count()
-        if not data or len(data) > tags_count:
-            raise ValidationError(
-                f'Количество тегов должно быть от 1 до {tags_count}.'
-            )
+        if not data:
+            raise ValidationError('Нужно указать хотя бы один тег.')
         if len(data) != len(set(data)):
             raise ValidationError('Введенные теги повторяются.')
-        return data
+        tags = Tag.objects.in_bulk(data)
+        for pk in data:
+            if pk not in tags:
+                raise ValidationError(
+                    f'Недопустимый первичный ключ "{pk}" - '
+                    f'объект не существует.'
+                )
+        return [tags[pk] for pk in data]
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создает новый рецепт."""
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags_data)
+        recipe.tags.add(*tags_data)
         ingredient_amount_set(recipe, ingredients_data)
-        recipe.save()
+        index_recipe(
+            recipe.pk,
+            [ingredient['id'] for ingredient in ingredients_data],
+            created=True
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Обновляет существующий рецепт."""
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get('cooking_time',
                                                    instance.cooking_time)
-        tags_data = validated_data.pop('tags')
-        ingredients_data = validated_data.pop('ingredients')
-        instance.tags.set(tags_data)
-        IngredientAmount.objects.filter(recipe=instance).delete()
-        ingredient_amount_set(instance, ingredients_data)
+        instance.image = validated_data.get('image', instance.image)
+        tags_data = validated_data.pop('tags', None)
+        ingredients_data = validated_data.pop('ingredients', None)
+        # save() один раз обновляет updated_at, в том числе когда
+        # меняются только ингредиенты или теги.
         instance.save()
+        if tags_data is not None:
+            instance.tags.set(tags_data)
+        if ingredients_data is not None:
+            changes = ingredient_amount_update(instance, ingredients_data)
+            ShoppingListItem.objects.change_amounts(
+                instance.in_shopping_cart.values_list('user_id', flat=True),
+                changes
+            )
+            if changes:
+                index_recipe(instance.pk, [
+                    ingredient['id'] for ingredient in ingredients_data
+                ])
         return instance
 
     def to_representation(self, instance):
+        instance = Recipe.objects.with_related().with_user_flags(
+            self.context['request'].user
+        ).get(pk=instance.pk)
         serializer = RecipeReadSerializer(instance, context=self.context)
         return serializer.data
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Отображает авторов, на которых подписан пользователь."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'recipes', 'recipes_count')
+                  'last_name', 'is_subscribed', 'recipes', 'recipes_count',
+                  'followers_count')
         model = User
         read_only_fields = [
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'recipes', 'recipes_count'
+            'is_subscribed', 'recipes', 'recipes_count', 'followers_count'
         ]
 
     def validate(self, data):
@@ -249,13 +334,20 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_recipes(self, obj):
         """Возвращает краткие рецепты автора."""
-        recipes_limit = int(self.context['request'].query_params.get(
-            'recipes_limit', default=3)
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes_limit = get_recipes_limit(self.context['request'])
+            recipes = obj.recipes.all()[:recipes_limit]
+        serializer = FavouriteRecipeSerializer(
+            recipes, many=True, context=self.context
         )
-        recipes = obj.recipes.all()[:recipes_limit]
-        serializer = FavouriteRecipeSerializer(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, following):
         """Определяет сколько рецептов создано пользователем."""
-        return following.recipes.count()
+        return get_user_counter(following, 'recipes_count')
+
+    def get_followers_count(self, following):
+        """Возвращает количество подписчиков автора."""
+        return get_user_counter(following, 'followers_count')
@@ -0,0 +1,79 @@
+import csv
+import json
+
+from recipes.models import ShoppingListItem
+
+CURSOR_CHUNK_SIZE = 500
+LINES_PER_CHUNK = 100
+
+
+def shopping_list_rows(user):
+    """Читает список покупок пользователя серверным курсором."""
+    ingredients_to_buy = ShoppingListItem.objects.filter(
+        user=user
+    ).order_by('ingredient__name').values_list(
+        'ingredient__name', 'amount', 'ingredient__measurement_unit'
+    ).iterator(chunk_size=CURSOR_CHUNK_SIZE)
+    for name, amount, measurement_unit in ingredients_to_buy:
+        yield {
+            'name': name,
+            'amount': amount,
+            'measurement_unit': measurement_unit,
+        }
+
+
+def render_txt(rows):
+    """Формирует список покупок в виде текста."""
+    yield 'Список продуктов для покупки.\n'
+    for index, row in enumerate(rows, 1):
+        intend = 2 if index < 10 else 1
+        yield (
+            f'\n{index}.{" " * intend}{row["name"].capitalize()} - '
+            f'{row["amount"]} {row["measurement_unit"]}.'
+        )
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку для csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    """Формирует список покупок в формате csv."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for row in rows:
+        yield writer.writerow(
+            (row['name'], row['amount'], row['measurement_unit'])
+        )
+
+
+def render_json(rows):
+    """Формирует список покупок в формате json."""
+    yield '['
+    for index, row in enumerate(rows):
+        separator = ', ' if index else ''
+        yield separator + json.dumps(row, ensure_ascii=False)
+    yield ']'
+
+
+SHOPPING_LIST_RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'json': render_json,
+}
+
+
+def stream_shopping_list(user, file_format):
+    """Отдает список покупок частями по LINES_PER_CHUNK строк."""
+    lines = SHOPPING_LIST_RENDERERS[file_format](shopping_list_rows(user))
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= LINES_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes.models import Favourites, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Follow
+
+from .caching import bump_cache_version
+from .ingredient_index import ingredient_index
+from .metrics import store
+
+User = get_user_model()
+
+# Поля пользователя, которые выводятся в рецептах.
+USER_RECIPE_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс ингредиентов при их изменении."""
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_ingredients_cache_version(sender, **kwargs):
+    """Сбрасывает кэш списка ингредиентов и индексы ингредиентов
+        во всех процессах после фиксации изменений."""
+    transaction.on_commit(lambda: bump_cache_version('ingredients'))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_tags_cache_version(sender, **kwargs):
+    """Сбрасывает кэш списка тегов при их изменении."""
+    bump_cache_version('tags')
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipes_cache_version(sender, **kwargs):
+    """Сбрасывает кэш списка рецептов после фиксации изменений их данных.
+
+    Ингредиенты рецепта меняются только вместе с самим рецептом,
+    поэтому отдельного обработчика для IngredientAmount нет.
+    """
+    transaction.on_commit(lambda: bump_cache_version('recipes'))
+
+
+@receiver([post_save, post_delete], sender=Favourites)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Follow)
+def bump_recipes_cache_version_on_counter_change(sender, **kwargs):
+    """Сбрасывает кэш списка рецептов при изменении счетчиков избранного,
+        списков покупок и подписчиков, которые выводятся в рецептах.
+
+    Счетчики меняются через queryset.update() без сигналов моделей.
+    """
+    if kwargs.get('created', True):
+        bump_recipes_cache_version(sender)
+
+
+@receiver(pre_save, sender=User)
+def remember_user_recipe_fields(sender, instance, raw=False,
+                                update_fields=None, **kwargs):
+    """Запоминает поля пользователя, выводимые в рецептах, до сохранения."""
+    if raw or instance.pk is None or (
+        update_fields is not None
+        and not set(update_fields) & set(USER_RECIPE_FIELDS)
+    ):
+        return
+    instance._recipe_fields = User.objects.filter(pk=instance.pk).values_list(
+        *USER_RECIPE_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=User)
+def bump_recipes_cache_version_on_user_change(sender, instance, **kwargs):
+    """Сбрасывает кэш списка рецептов, если изменились имя или почта
+        пользователя, а не, например, время последнего входа."""
+    old = instance.__dict__.pop('_recipe_fields', None)
+    if old is not None and old != tuple(
+        getattr(instance, field) for field in USER_RECIPE_FIELDS
+    ):
+        bump_recipes_cache_version(sender)
+
+
+@receiver(connection_created)
+def count_db_connection(sender, connection, **kwargs):
+    """Учитывает открытие соединения с базой в метриках."""
+    store.inc(
+        'foodgram_db_connections_created_total', {'alias': connection.alias}
+    )
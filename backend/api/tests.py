@@ -0,0 +1,365 @@
+import base64
+import json
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.utils import timezone
+from PIL import Image
+
+from rest_framework.test import APIClient, APITestCase
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+
+from api.extra_fields import ImageVariantsField
+from api.profiling import PROFILE_HEADER, ProfilingMiddleware
+from recipes.models import (Favourites, Ingredient, IngredientAmount, Recipe,
+                            ShoppingListItem, Tag, User)
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+class LoadDataTest(SimpleTestCase):
+    """Тесты команды загрузки ингредиентов."""
+
+    def test_batch_size_must_be_positive(self):
+        """Размер пачки меньше единицы отклоняется до загрузки."""
+        for value in ('0', '-5', 'abc'):
+            with self.subTest(value=value):
+                with self.assertRaisesMessage(CommandError, 'batch-size'):
+                    call_command('load_data', '--batch-size', value)
+
+
+class LoadDataUpdateTest(TestCase):
+    """Тесты обновления ингредиентов командой load_data."""
+
+    def test_changed_unit_touches_recipes(self):
+        """Смена единицы измерения меняет время изменения рецептов
+            с этим ингредиентом."""
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='блины', text='блины', cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+        IngredientAmount.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=100
+        )
+        updated_at = Recipe.objects.get(pk=recipe.pk).updated_at
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'ingredients.json'
+            path.write_text(json.dumps(
+                [{'name': 'мука', 'measurement_unit': 'кг'}]
+            ))
+            call_command('load_data', str(path), stdout=StringIO())
+        self.assertGreater(
+            Recipe.objects.get(pk=recipe.pk).updated_at, updated_at
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipeListCacheTest(TestCase):
+    """Тесты кэша списка рецептов для анонимных пользователей."""
+
+    def test_favourite_updates_cached_counter(self):
+        """Добавление в избранное сбрасывает закэшированный список."""
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='блины', text='блины', cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['favourites_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favourites.objects.create(user=author, recipe=recipe)
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['favourites_count'], 1)
+
+
+class ImageVariantsFieldTest(SimpleTestCase):
+    """Тесты ссылок на уменьшенные копии картинки рецепта."""
+
+    @override_settings(RECIPE_IMAGE_VARIANTS={'thumbnail': 240, 'new': 720})
+    def test_missing_size_falls_back_to_image(self):
+        """Для размера без копии отдается исходная картинка,
+            а копии считаются устаревшими."""
+        recipe = Recipe(image='recipes/images/test.jpg', image_variants={
+            'source': 'recipes/images/test.jpg',
+            'thumbnail': 'recipes/variants/test_thumbnail.webp',
+        })
+        self.assertEqual(ImageVariantsField().to_representation(recipe), {
+            'thumbnail': recipe.image.storage.url(
+                'recipes/variants/test_thumbnail.webp'
+            ),
+            'new': recipe.image.url,
+        })
+        self.assertTrue(recipe.image_variants_outdated)
+
+
+class ProfilingMiddlewareTest(SimpleTestCase):
+    """Тесты включения профилирования запросом."""
+
+    def profile(self, value):
+        request = RequestFactory().get('/api/tags/', {'profile': value})
+        request.user = SimpleNamespace(is_authenticated=True, is_staff=True)
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=directory
+        ):
+            response = ProfilingMiddleware(
+                lambda request: HttpResponse()
+            )(request)
+        return response.has_header(PROFILE_HEADER)
+
+    def test_only_explicit_values_enable_profiling(self):
+        """Профилирование включают только 1, true и inline."""
+        for value in ('1', 'true', 'TRUE', 'inline'):
+            with self.subTest(value=value):
+                self.assertTrue(self.profile(value))
+        for value in ('0', 'false', 'no', 'yes', ''):
+            with self.subTest(value=value):
+                self.assertFalse(self.profile(value))
+
+
+class GenerateDatasetTest(TestCase):
+    """Тесты команды генерации синтетических данных."""
+
+    def test_usernames_continue_after_existing(self):
+        """Новые имена не совпадают с существующими, даже если
+            номера заняты не подряд."""
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        for username in ('user2', 'userX'):
+            User.objects.create_user(
+                username=username, email=f'{username}@example.com',
+                password='pass'
+            )
+        call_command(
+            'generate_dataset', users=3, recipes=0, follows=0,
+            favourites=0, cart=0, stdout=StringIO()
+        )
+        self.assertEqual(
+            set(User.objects.filter(
+                username__startswith='user'
+            ).values_list('username', flat=True)),
+            {'user2', 'userX', 'user3', 'user4', 'user5'}
+        )
+
+
+def png_data_uri():
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), '#49B64E').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, IMAGE_WORKERS=0)
+class ShoppingListTest(APITestCase):
+    """Тесты суммарных списков покупок, обновляемых по изменениям."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        media_root = override_settings(MEDIA_ROOT=self.media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.addCleanup(self.media.cleanup)
+        self.author, self.first, self.second = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass'
+            )
+            for name in ('author', 'first', 'second')
+        )
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        self.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch'
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def ingredients_data(self, amounts):
+        return [
+            {'id': self.ingredients[index].pk, 'amount': amount}
+            for index, amount in amounts.items()
+        ]
+
+    def create_recipe(self, amounts):
+        response = self.client_for(self.author).post('/api/recipes/', {
+            'ingredients': self.ingredients_data(amounts),
+            'tags': [self.tag.pk], 'name': 'рецепт', 'text': 'текст',
+            'cooking_time': 10, 'image': png_data_uri(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def assert_matches_recompute(self):
+        """Списки покупок совпадают с посчитанными заново."""
+        self.assertEqual(
+            set(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )),
+            set(ShoppingListItem.objects.aggregated())
+        )
+
+    def test_incremental_lists_match_recompute(self):
+        """Списки покупок совпадают с полным пересчетом после добавления,
+            изменения и удаления рецептов."""
+        soup = self.create_recipe({0: 100, 1: 50, 2: 10})
+        salad = self.create_recipe({1: 30, 3: 5})
+        for user in (self.first, self.second):
+            for recipe_id in (soup, salad):
+                response = self.client_for(user).post(
+                    f'/api/recipes/{recipe_id}/shopping_cart/'
+                )
+                self.assertEqual(response.status_code, 201)
+        self.assert_matches_recompute()
+        self.assertEqual(
+            ShoppingListItem.objects.get(
+                user=self.first, ingredient=self.ingredients[1]
+            ).amount,
+            80
+        )
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{soup}/',
+            {'ingredients': self.ingredients_data({0: 150, 2: 10, 4: 7})},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_matches_recompute()
+        response = self.client_for(self.first).delete(
+            f'/api/recipes/{salad}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_matches_recompute()
+        response = self.client_for(self.author).delete(f'/api/recipes/{soup}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_matches_recompute()
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.first).exists()
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipeCursorTest(APITestCase):
+    """Тесты постраничного вывода рецептов по курсору."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        self.client.force_authenticate(self.user)
+        published = timezone.now()
+        for index in range(7):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'рецепт {index}', text='текст',
+                cooking_time=10, image='recipes/images/test.jpg'
+            )
+            # У части рецептов одинаковое время публикации,
+            # порядок между ними задает id.
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=published - timedelta(minutes=index // 3)
+            )
+
+    def test_cursor_pages_cover_all_recipes_in_order(self):
+        """Переход по ссылкам next выдает все рецепты по одному разу
+            в том же порядке, что и постраничный вывод."""
+        ids = []
+        url = '/api/recipes/?limit=2&cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids.extend(recipe['id'] for recipe in data['results'])
+            url = data['next']
+        self.assertEqual(ids, list(Recipe.objects.order_by(
+            '-pub_date', '-pk'
+        ).values_list('pk', flat=True)))
+        response = self.client.get('/api/recipes/?limit=50')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']], ids
+        )
+
+    def test_count_on_request(self):
+        """Количество отдается в режиме курсора только с count=1."""
+        self.assertNotIn(
+            'count', self.client.get('/api/recipes/?cursor=').json()
+        )
+        self.assertEqual(
+            self.client.get('/api/recipes/?cursor=&count=1').json()['count'],
+            7
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FeedTest(APITestCase):
+    """Тесты ленты рецептов авторов, на которых подписан пользователь."""
+
+    def setUp(self):
+        self.author, self.reader = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass'
+            )
+            for name in ('author', 'reader')
+        )
+        self.old = self.publish('старый')
+        self.client.force_authenticate(self.reader)
+
+    def publish(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, text=name, cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+
+    def feed(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def check_subscribe_and_unsubscribe(self):
+        self.assertEqual(self.feed(), [])
+        response = self.client.post(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.feed(), [self.old.pk])
+        new = self.publish('новый')
+        self.assertEqual(self.feed(), [new.pk, self.old.pk])
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.feed(), [])
+
+    def test_feed_from_timeline(self):
+        """Рецепты автора появляются в ленте после подписки,
+            новые рецепты добавляются, после отписки лента пуста."""
+        self.check_subscribe_and_unsubscribe()
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_feed_of_popular_author(self):
+        """Рецепты автора, не раскладываемые по лентам, тоже
+            выводятся в ленте подписчика."""
+        self.check_subscribe_and_unsubscribe()
+        self.assertFalse(self.reader.timeline_entries.exists())
@@ -2,6 +2,7 @@ from django.urls import include, path, re_path
 
 from rest_framework.routers import DefaultRouter
 
+from api.metrics import metrics_view
 from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
 
 app_name = 'api'
@@ -14,6 +15,7 @@ router.register('recipes', RecipeViewSet, 'recipes')
 
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     re_path(r'^auth/', include('djoser.urls.authtoken')),
@@ -1,14 +1,79 @@
-from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import Ingredient, IngredientAmount
+from recipes.models import IngredientAmount
+
+RECIPES_LIMIT_DEFAULT = 3
+RECIPES_LIMIT_MAX = 50
 
 
 def ingredient_amount_set(recipe, ingredients_data):
     """Создает связи рецепта с количеством ингредиента."""
-    for ingredient_data in ingredients_data:
-        id = ingredient_data.get('id')
-        ingredient_id = get_object_or_404(Ingredient, id=id)
-        amount = ingredient_data.get('amount')
-        IngredientAmount.objects.create(
-            recipe=recipe, ingredient=ingredient_id, amount=amount
+    IngredientAmount.objects.bulk_create(
+        IngredientAmount(
+            recipe=recipe,
+            ingredient_id=ingredient_data.get('id'),
+            amount=ingredient_data.get('amount')
+        )
+        for ingredient_data in ingredients_data
+    )
+
+
+def ingredient_amount_update(recipe, ingredients_data):
+    """Обновляет связи рецепта с количеством ингредиента.
+
+    Удаляются, изменяются и добавляются только те строки,
+    которые отличаются от сохраненных. Возвращает изменения количества
+    в виде словаря {id ингредиента: изменение}.
+    """
+    current = {
+        ingredient_amount.ingredient_id: ingredient_amount
+        for ingredient_amount in IngredientAmount.objects.filter(
+            recipe=recipe
+        )
+    }
+    new_amounts = {
+        ingredient_data.get('id'): ingredient_data.get('amount')
+        for ingredient_data in ingredients_data
+    }
+    changes = {}
+    to_delete = []
+    for ingredient_id, ingredient_amount in current.items():
+        if ingredient_id not in new_amounts:
+            to_delete.append(ingredient_amount.pk)
+            changes[ingredient_id] = -ingredient_amount.amount
+    to_update = []
+    to_create = []
+    for ingredient_id, amount in new_amounts.items():
+        ingredient_amount = current.get(ingredient_id)
+        if ingredient_amount is None:
+            to_create.append({'id': ingredient_id, 'amount': amount})
+            changes[ingredient_id] = amount
+        elif ingredient_amount.amount != amount:
+            changes[ingredient_id] = amount - ingredient_amount.amount
+            ingredient_amount.amount = amount
+            to_update.append(ingredient_amount)
+    if to_delete:
+        IngredientAmount.objects.filter(pk__in=to_delete).delete()
+    if to_update:
+        IngredientAmount.objects.bulk_update(to_update, ['amount'])
+    if to_create:
+        ingredient_amount_set(recipe, to_create)
+    return changes
+
+
+def get_recipes_limit(request):
+    """Возвращает проверенное значение параметра recipes_limit."""
+    recipes_limit = request.query_params.get(
+        'recipes_limit', RECIPES_LIMIT_DEFAULT
+    )
+    try:
+        recipes_limit = int(recipes_limit)
+    except (TypeError, ValueError):
+        raise ValidationError(
+            {'recipes_limit': 'Значение должно быть целым числом.'}
+        )
+    if recipes_limit < 0:
+        raise ValidationError(
+            {'recipes_limit': 'Значение не может быть отрицательным.'}
         )
+    return min(recipes_limit, RECIPES_LIMIT_MAX)
@@ -1,35 +1,62 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Value, prefetch_related_objects)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import permissions, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.status import HTTP_201_CREATED, HTTP_204_NO_CONTENT
 
 from djoser.views import UserViewSet as DjoserUserViewSet
 
-from recipes.models import (Favourites, Ingredient, Recipe,
-                            ShoppingCart, Tag, User)
+from recipes.models import (Favourites, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, User)
+from recipes.similarity import similar_recipe_ids
 
 from users.models import Follow
 
+from .caching import VersionedCacheMixin, recipe_validators
 from .filters import IngredientFilter, RecipeFilter
+from .paginators import RecipePagination
 from .permissions import IsAuthorOrAuthenticatedOrReadOnly, IsSubscribeOnly
+from .renderers import CSVRenderer, PlainTextRenderer
 from .serializers import (FavouriteRecipeSerializer, FollowSerializer,
                           IngredientSerializer, RecipeReadSerializer,
                           RecipeWriteSerializer, TagSerializer, UserSerializer)
+from .shopping_list import stream_shopping_list
+from .utils import get_recipes_limit
 
 
 class UserViewSet(DjoserUserViewSet):
     """Вьюсет для работы с пользователями"""
 
     http_method_names = ['get', 'post', 'head', 'delete']
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('counters').order_by('id')
     serializer_class = UserSerializer
 
+    def get_queryset(self):
+        """Добавляет признак подписки текущего пользователя."""
+
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, following=OuterRef('pk'))
+        ))
+
     def get_permissions(self):
         """Дает доступ к определенным эндпоинтам только аутентифицированным
         пользователям и разрешает метод delete только для своих подписок."""
@@ -45,8 +72,16 @@ class UserViewSet(DjoserUserViewSet):
         """Просмотр своих подписок."""
 
         user = self.request.user
-        user_following = User.objects.filter(following__user=user)
+        recipes_limit = get_recipes_limit(request)
+        user_following = User.objects.filter(
+            following__user=user
+        ).select_related('counters').order_by('id')
         page = self.paginate_queryset(user_following)
+        prefetch_related_objects(page, Prefetch(
+            'recipes',
+            queryset=Recipe.objects.latest_per_author(page, recipes_limit),
+            to_attr='latest_recipes'
+        ))
         serializer = FollowSerializer(
             page, context={'request': request}, many=True
         )
@@ -76,43 +111,109 @@ class UserViewSet(DjoserUserViewSet):
             return Response(status=HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для работы с тегами."""
 
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
+    authentication_classes = []
+    cache_namespace = 'tags'
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для работы с ингредиентами."""
 
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
+    authentication_classes = []
     filter_backends = [IngredientFilter]
     search_fields = ('^name',)
+    cache_namespace = 'ingredients'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    """Вьюсет для работы с рецептами."""
+class RecipeViewSet(VersionedCacheMixin, viewsets.ModelViewSet):
+    """Вьюсет для работы с рецептами.
+
+    Список рецептов для анонимных пользователей кэшируется целиком.
+    """
 
     http_method_names = ['get', 'post', 'head', 'patch', 'delete']
-    queryset = (
-        Recipe.objects.select_related('author')
-        .prefetch_related('ingredients', 'tags').all()
-    )
+    queryset = Recipe.objects.with_related()
     permission_classes = [IsAuthorOrAuthenticatedOrReadOnly]
+    pagination_class = RecipePagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    cache_namespace = 'recipes'
+    cache_timeout = settings.RECIPE_LIST_CACHE_TIMEOUT
+
+    def use_response_cache(self, request):
+        """Кэширует список только для анонимов: у них нет своих признаков."""
+        return (
+            request.user.is_anonymous
+            and super().use_response_cache(request)
+        )
+
+    def get_queryset(self):
+        """Добавляет признаки текущего пользователя к рецептам."""
+
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'feed'):
+            queryset = queryset.with_user_flags(self.request.user)
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """Отдает рецепт или 304, если у клиента актуальная версия."""
+
+        etag, last_modified = recipe_validators(request, kwargs['pk'])
+        if etag is None:
+            return super().retrieve(request, *args, **kwargs)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия"""
 
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Рецепты с наиболее похожими ингредиентами и тегами."""
+
+        recipe = get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        ids = similar_recipe_ids(recipe.pk, settings.SIMILAR_RECIPES_LIMIT)
+        recipes = Recipe.objects.only(
+            'name', 'image', 'image_variants', 'cooking_time'
+        ).in_bulk(ids)
+        serializer = FavouriteRecipeSerializer(
+            [recipes[pk] for pk in ids if pk in recipes],
+            many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+
+        queryset = self.filter_queryset(
+            self.get_queryset().feed(request.user)
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -151,21 +252,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         if request.method == 'POST':
-            ShoppingCart.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+                ShoppingListItem.objects.add_recipe(user, recipe)
             return Response(serializer.data, status=HTTP_201_CREATED)
         if request.method == 'DELETE':
-            ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
+            with transaction.atomic():
+                ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
+                ShoppingListItem.objects.remove_recipe([user.pk], recipe)
             return Response(status=HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer])
     def download_shopping_cart(self, request):
-        """Отдает пользователю список для покупок в виде текстового файла."""
+        """Отдает пользователю список для покупок в виде файла.
+
+        Формат выбирается параметром format: txt (по умолчанию), csv, json.
+        """
 
-        shopping_list_text = ShoppingCart.shopping_list_text(self, request)
-        response = HttpResponse(content_type='text/plain')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            stream_shopping_list(request.user, renderer.format),
+            content_type=f'{renderer.media_type}; charset=utf-8'
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
-        response.write(shopping_list_text)
         return response
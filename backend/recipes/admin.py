@@ -1,35 +1,60 @@
 from django.contrib import admin
 
+from .admin_filters import input_filter
 from .models import (Favourites, Ingredient, IngredientAmount, Recipe,
                      ShoppingCart, Tag)
 
+RecipeNameFilter = input_filter(
+    'названию рецепта', 'recipe_name', 'recipe__name__icontains'
+)
+UsernameFilter = input_filter(
+    'имени пользователя', 'username', 'user__username__istartswith'
+)
+
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
 
 
 class IngredientAmountAdmin(admin.ModelAdmin):
     list_display = ('amount', 'recipe', 'ingredient')
+    list_select_related = ('recipe', 'ingredient')
     search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
 class IngredientInline(admin.TabularInline):
     model = IngredientAmount
     extra = 0
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient'
+        )
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'in_favourite_count')
+    list_display = (
+        'name', 'author', 'in_favourite_count', 'shopping_cart_count'
+    )
+    list_select_related = ('author',)
     search_fields = ('name', 'author__username', 'tags__name')
-    list_filter = ('name', 'author__username', 'tags__name')
-    readonly_fields = ('in_favourite_count', )
+    list_filter = (
+        input_filter(
+            'имени автора', 'author_username', 'author__username__istartswith'
+        ),
+        'tags',
+    )
+    readonly_fields = ('in_favourite_count', 'shopping_cart_count')
+    autocomplete_fields = ('author',)
     inlines = (IngredientInline,)
 
     def in_favourite_count(self, recipe):
-        """Подсчитывает сколько раз рецепт добавлен в избранное."""
-        return recipe.favourite.count()
+        """Показывает сколько раз рецепт добавлен в избранное."""
+        return recipe.favourites_count
 
     in_favourite_count.short_description = 'В избранном'
 
@@ -40,14 +65,18 @@ class TagAdmin(admin.ModelAdmin):
 
 class FavouritesAdmin(admin.ModelAdmin):
     list_display = ('pk', 'recipe', 'user')
+    list_select_related = ('recipe', 'user')
     search_fields = ('user__username', 'recipe__name')
-    list_filter = ('user__username', 'recipe__name')
+    list_filter = (UsernameFilter, RecipeNameFilter)
+    autocomplete_fields = ('recipe', 'user')
 
 
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('pk', 'recipe', 'user')
+    list_select_related = ('recipe', 'user')
     search_fields = ('user__username', 'recipe__name')
-    list_filter = ('user__username', 'recipe__name')
+    list_filter = (UsernameFilter, RecipeNameFilter)
+    autocomplete_fields = ('recipe', 'user')
 
 
 admin.site.register(Ingredient, IngredientAdmin)
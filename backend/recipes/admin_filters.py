@@ -0,0 +1,37 @@
+from django.contrib import admin
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка всех возможных значений.
+
+    Подходит для полей с большим количеством значений: в боковой панели
+    не строится список, а выборка фильтруется по лукапу lookup.
+    """
+    template = 'admin/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = (
+            (name, value)
+            for name, value in changelist.get_filters_params().items()
+            if name != self.parameter_name
+        )
+        yield all_choice
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup: self.value().strip()})
+        return queryset
+
+
+def input_filter(title, parameter_name, lookup):
+    """Создает фильтр с полем ввода для лукапа lookup."""
+    return type(
+        f'{parameter_name.title().replace("_", "")}Filter',
+        (InputFilter,),
+        {'title': title, 'parameter_name': parameter_name, 'lookup': lookup}
+    )
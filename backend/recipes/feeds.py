@@ -0,0 +1,53 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """Возвращает общий пул потоков для заполнения лент."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FEED_WORKERS,
+                thread_name_prefix='recipe-feeds'
+            )
+    return _executor
+
+
+def run_in_worker(author_id, since):
+    """Заполняет ленты подписчиков автора в потоке пула."""
+    try:
+        TimelineEntry.objects.backfill_followers(author_id, since)
+    except Exception:
+        logger.exception(
+            'Не удалось заполнить ленты подписчиков автора %s', author_id
+        )
+    finally:
+        connection.close()
+
+
+def schedule_backfill_followers(author_id, since):
+    """Ставит заполнение лент подписчиков автора в очередь после коммита.
+
+    Если FEED_WORKERS равен 0, ленты заполняются сразу в текущем потоке.
+    Пропущенные из-за ошибки записи восстанавливает rebuild_timelines.
+    """
+    if settings.FEED_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            run_in_worker, author_id, since
+        ))
+    else:
+        transaction.on_commit(
+            lambda: TimelineEntry.objects.backfill_followers(author_id, since)
+        )
@@ -0,0 +1,113 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image
+
+from .models import DetachedFile, Recipe
+
+VARIANTS_DIR = 'recipes/variants/'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """Возвращает общий пул потоков для обработки картинок."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+    return _executor
+
+
+def render_variant(image, size):
+    """Возвращает картинку, вписанную в квадрат size, в формате WebP."""
+    variant = image.copy()
+    variant.thumbnail((size, size))
+    buffer = BytesIO()
+    variant.save(
+        buffer, 'WEBP', quality=settings.RECIPE_IMAGE_VARIANT_QUALITY
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def generate_image_variants(recipe):
+    """Сохраняет уменьшенные копии картинки рецепта.
+
+    Возвращает словарь {название: путь к файлу} с путем
+    к исходной картинке под ключом source.
+    """
+    storage = recipe.image.storage
+    stem = PurePosixPath(recipe.image.name).stem
+    variants = {'source': recipe.image.name}
+    with recipe.image.open('rb'), Image.open(recipe.image.file) as image:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info else 'RGB'
+            )
+        for name, size in settings.RECIPE_IMAGE_VARIANTS.items():
+            variants[name] = storage.save(
+                f'{VARIANTS_DIR}{stem}_{name}.webp',
+                render_variant(image, size)
+            )
+    return variants
+
+
+def process_recipe_image(recipe_id, force=False):
+    """Создает уменьшенные копии картинки рецепта и сохраняет их пути.
+
+    Возвращает True, если копии были созданы.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return False
+    if not (force or recipe.image_variants_outdated):
+        return False
+    variants = generate_image_variants(recipe)
+    with transaction.atomic():
+        current_image = Recipe.objects.select_for_update().filter(
+            pk=recipe_id
+        ).values_list('image', flat=True).first()
+        if current_image != recipe.image.name:
+            DetachedFile.objects.detach(variants.values())
+            return False
+        recipe.image_variants = variants
+        recipe.save(update_fields=['image_variants', 'updated_at'])
+    return True
+
+
+def run_in_worker(recipe_id, force=False):
+    """Обрабатывает картинку рецепта в потоке пула."""
+    try:
+        return process_recipe_image(recipe_id, force)
+    except Exception:
+        logger.exception(
+            'Не удалось создать копии картинки рецепта %s', recipe_id
+        )
+        return False
+    finally:
+        connection.close()
+
+
+def schedule_image_variants(recipe_id):
+    """Ставит создание копий картинки в очередь после коммита.
+
+    Если IMAGE_WORKERS равен 0, копии создаются сразу в текущем потоке.
+    """
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_worker, recipe_id)
+        )
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
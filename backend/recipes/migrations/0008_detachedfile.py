@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetachedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь к файлу')),
+                ('detached_at', models.DateTimeField(auto_now_add=True, verbose_name='Когда откреплен')),
+            ],
+            options={
+                'verbose_name': 'Открепленный файл',
+                'verbose_name_plural': 'Открепленные файлы',
+            },
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:26
+
+import hashlib
+import random
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+# Копия recipes.similarity.band_buckets на момент создания миграции,
+# чтобы последующие изменения модуля не меняли эту миграцию.
+def band_buckets(ingredient_ids):
+    bands = settings.SIMILAR_RECIPES_BANDS
+    rows = settings.SIMILAR_RECIPES_ROWS
+    rng = random.Random(f'similar-recipes:{bands * rows}')
+    hash_functions = [
+        (rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME))
+        for _ in range(bands * rows)
+    ]
+    ingredient_ids = set(ingredient_ids)
+    signature = [
+        min((a * x + b) % MERSENNE_PRIME for x in ingredient_ids)
+        for a, b in hash_functions
+    ]
+    return {
+        band: int.from_bytes(
+            hashlib.blake2b(
+                repr((band, *signature[band * rows:(band + 1) * rows])
+                     ).encode(),
+                digest_size=8
+            ).digest(),
+            'big', signed=True
+        )
+        for band in range(bands)
+    }
+
+
+def fill_similarity_buckets(apps, schema_editor):
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    SimilarityBucket = apps.get_model('recipes', 'SimilarityBucket')
+    ingredients = {}
+    for recipe_id, ingredient_id in IngredientAmount.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    ).iterator():
+        ingredients.setdefault(recipe_id, []).append(ingredient_id)
+    SimilarityBucket.objects.bulk_create(
+        (
+            SimilarityBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+            for recipe_id, ingredient_ids in ingredients.items()
+            for band, bucket in band_buckets(ingredient_ids).items()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='Номер полосы')),
+                ('bucket', models.BigIntegerField(verbose_name='Хэш полосы')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Корзина похожих рецептов',
+                'verbose_name_plural': 'Корзины похожих рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='similaritybucket',
+            index=models.Index(fields=['bucket'], name='similarity_bucket_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='similaritybucket',
+            constraint=models.UniqueConstraint(fields=('recipe', 'band'), name='unique_recipe_band'),
+        ),
+        migrations.RunPython(
+            fill_similarity_buckets, migrations.RunPython.noop
+        ),
+    ]
@@ -1,12 +1,20 @@
 import re
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.expressions import RawSQL, Window
+from django.db.models.functions import Greatest, RowNumber
 from django.forms import ValidationError
+from django.utils import timezone
 
 User = get_user_model()
 
+SEARCH_CONFIG = 'russian'
+
 
 def validate_color(value):
     """Проверяет цвет тега на уникальность и соответствие hex-color."""
@@ -22,6 +30,16 @@ def validate_color(value):
         )
 
 
+def change_counter(queryset, field, delta, **fields):
+    """Атомарно изменяет счетчик field у объектов queryset на delta
+        и обновляет время их изменения и поля fields."""
+    return queryset.update(
+        updated_at=timezone.now(),
+        **{field: Greatest(models.F(field) + delta, 0)},
+        **fields
+    )
+
+
 class Ingredient(models.Model):
     """Модель ингредиентов для рецепта"""
     name = models.CharField(verbose_name='Название ингредиента',
@@ -62,12 +80,125 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для рецептов."""
+
+    def with_user_flags(self, user):
+        """Добавляет к рецептам признаки избранного, списка покупок
+            и подписки на автора для текущего пользователя."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()),
+                is_author_subscribed=models.Value(
+                    False, output_field=models.BooleanField()),
+            )
+        from users.models import Follow
+        return self.annotate(
+            is_favorited=models.Exists(Favourites.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_author_subscribed=models.Exists(Follow.objects.filter(
+                user=user, following=models.OuterRef('author'))),
+        )
+
+    def search(self, text):
+        """Ищет рецепты по названию и тексту, лучшие совпадения первыми.
+
+        В PostgreSQL используется индексированный поисковый вектор,
+        в остальных базах - поиск подстроки.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            query = SearchQuery(
+                text, config=SEARCH_CONFIG, search_type='websearch'
+            )
+            return self.filter(search_vector=query).annotate(
+                search_rank=SearchRank(models.F('search_vector'), query)
+            ).order_by('-search_rank', '-pub_date')
+        return self.filter(
+            models.Q(name__icontains=text) | models.Q(text__icontains=text)
+        ).annotate(
+            search_rank=models.Case(
+                models.When(name__icontains=text, then=models.Value(1.0)),
+                default=models.Value(0.5),
+                output_field=models.FloatField()
+            )
+        ).order_by('-search_rank', '-pub_date')
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты с количеством.
+
+        Поисковый вектор нужен только в условиях поиска и не загружается.
+        """
+        return self.defer('search_vector').select_related(
+            'author', 'author__counters'
+        ).prefetch_related(
+            models.Prefetch(
+                'ingredient_amount',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient'
+                ).order_by('ingredient__name')
+            ),
+            'tags'
+        )
+
+    def feed(self, user):
+        """Рецепты авторов, на которых подписан пользователь, новые первыми.
+
+        Рецепты берутся из ленты пользователя одним проходом по индексу.
+        Рецепты авторов, у которых подписчиков больше FEED_FANOUT_LIMIT,
+        в ленты не раскладываются и добавляются при чтении.
+        """
+        from users.models import Follow
+        popular_authors = Follow.objects.filter(
+            user=user,
+            following__counters__followers_count__gt=(
+                settings.FEED_FANOUT_LIMIT
+            )
+        ).values('following_id')
+        if not popular_authors.exists():
+            return self.filter(timeline_entries__user=user).order_by(
+                '-timeline_entries__pub_date', '-timeline_entries__recipe_id'
+            )
+        return self.filter(
+            models.Q(pk__in=TimelineEntry.objects.filter(
+                user=user
+            ).values('recipe_id'))
+            | models.Q(author__in=popular_authors)
+        ).order_by('-pub_date', '-pk')
+
+    def latest_per_author(self, authors, limit):
+        """Оставляет не более limit последних рецептов каждого автора.
+
+        Рецепты нумеруются оконной функцией внутри каждого автора,
+        поэтому выборка для любого числа авторов делается одним запросом.
+        """
+        ranked = self.model.objects.filter(author__in=authors).order_by(
+        ).annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=[models.F('author')],
+                order_by=[models.F('pub_date').desc(), models.F('pk').desc()],
+            )
+        ).values('pk', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE recipe_rank <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     name = models.CharField(verbose_name='Название блюда', max_length=255)
     text = models.TextField(verbose_name='Текст рецепта')
     pub_date = models.DateTimeField(verbose_name='Дата публикации',
                                     auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='Дата изменения',
+                                      auto_now=True)
     author = models.ForeignKey(
         User,
         verbose_name='Автор рецепта',
@@ -95,15 +226,57 @@ class Recipe(models.Model):
         verbose_name='Картинка',
         upload_to='recipes/images/'
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии картинки',
+        default=dict,
+        editable=False
+    )
+    favourites_count = models.PositiveIntegerField(
+        verbose_name='Сколько раз добавлен в избранное',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='Сколько раз добавлен в список покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    @property
+    def image_files(self):
+        """Пути ко всем файлам картинки рецепта и ее копий."""
+        return {self.image.name, *self.image_variants.values()} - {''}
+
+    @property
+    def image_variants_outdated(self):
+        """Уменьшенные копии не созданы для текущей картинки
+            или для части размеров RECIPE_IMAGE_VARIANTS."""
+        return bool(self.image) and (
+            self.image_variants.get('source') != self.image.name
+            or not settings.RECIPE_IMAGE_VARIANTS.keys()
+            <= self.image_variants.keys()
+        )
+
 
 class IngredientAmount(models.Model):
     """Модель для привязки количества ингредиента к рецепту"""
@@ -183,31 +356,315 @@ class ShoppingCart(models.Model):
             fields=['user', 'recipe'], name='unique_recipe_in_shopping_cart')
         ]
 
-    def shopping_list_text(self, request):
-        """Формирует список покупок."""
-
-        ingredients_to_buy = IngredientAmount.objects.filter(
-            recipe__in_shopping_cart__user=self.request.user).values(
-                'ingredient__name',
-                'ingredient__measurement_unit').annotate(
-                    amount_sum=models.Sum('amount')
-        ).order_by('ingredient__name').distinct()
-
-        shopping_list_text = 'Список продуктов для покупки.\n'
-
-        for index, ing in enumerate(ingredients_to_buy, 1):
-            ingredient = ing['ingredient__name'].capitalize()
-            amount = ing['amount_sum']
-            measure = ing['ingredient__measurement_unit']
-            if index < 10:
-                intend = 2
-            else:
-                intend = 1
-            new_line = (
-                f'\n{index}.{" " * intend}{ingredient} - {amount} {measure}.'
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListItemManager(models.Manager):
+    """Поддерживает суммарные списки покупок в актуальном состоянии."""
+
+    def change_amounts(self, user_ids, amounts):
+        """Прибавляет к спискам покупок пользователей количества
+            ингредиентов из словаря {id ингредиента: изменение}."""
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        try:
+            with transaction.atomic():
+                self._change_amounts(user_ids, amounts)
+        except IntegrityError:
+            # Такую же строку одновременно вставил другой запрос.
+            # Повторно она найдется и обновится вместо вставки.
+            with transaction.atomic():
+                self._change_amounts(user_ids, amounts)
+
+    def _change_amounts(self, user_ids, amounts):
+        items = list(self.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=amounts
+        ))
+        existing = set()
+        for item in items:
+            item.amount = Greatest(
+                models.F('amount') + amounts[item.ingredient_id], 0
             )
-            shopping_list_text += new_line
-        return shopping_list_text
+            existing.add((item.user_id, item.ingredient_id))
+        self.bulk_update(items, ['amount'])
+        self.bulk_create(
+            self.model(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()
+            if amount > 0 and (user_id, ingredient_id) not in existing
+        )
+        self.filter(
+            user_id__in=user_ids, ingredient_id__in=amounts, amount=0
+        ).delete()
+
+    def recipe_amounts(self, recipe, sign=1):
+        """Возвращает количества ингредиентов рецепта со знаком sign."""
+        return {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in IngredientAmount.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount')
+        }
+
+    def add_recipe(self, user, recipe):
+        """Добавляет ингредиенты рецепта в список покупок пользователя."""
+        self.change_amounts([user.pk], self.recipe_amounts(recipe))
+
+    def remove_recipe(self, user_ids, recipe):
+        """Убирает ингредиенты рецепта из списков покупок пользователей."""
+        self.change_amounts(user_ids, self.recipe_amounts(recipe, sign=-1))
+
+    def aggregated(self):
+        """Считает списки покупок заново по рецептам в корзинах."""
+        return IngredientAmount.objects.filter(
+            recipe__in_shopping_cart__isnull=False
+        ).values(
+            'ingredient_id', user_id=models.F('recipe__in_shopping_cart__user')
+        ).annotate(
+            amount_sum=models.Sum('amount')
+        ).order_by().values_list('user_id', 'ingredient_id', 'amount_sum')
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+
+    Обновляется при добавлении и удалении рецептов из списка покупок
+    и при изменении ингредиентов рецептов, которые в нем находятся.
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество ингредиента'
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_ingredient_in_shopping_list')
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient} - {self.amount}'
+
+
+class DetachedFileManager(models.Manager):
+    """Запоминает файлы, на которые могли перестать ссылаться рецепты."""
+
+    def detach(self, names):
+        """Добавляет файлы names в очередь на проверку."""
+        self.bulk_create(
+            (self.model(name=name) for name in set(names) if name),
+            ignore_conflicts=True
+        )
+
+
+class DetachedFile(models.Model):
+    """Файл, на который могли перестать ссылаться рецепты.
+
+    Файлы хранятся под хэшем содержимого и могут использоваться
+    несколькими рецептами, поэтому удаляются только командой
+    collect_images после проверки ссылок.
+    """
+    name = models.CharField(
+        verbose_name='Путь к файлу',
+        max_length=255,
+        unique=True
+    )
+    detached_at = models.DateTimeField(
+        verbose_name='Когда откреплен',
+        auto_now_add=True
+    )
+
+    objects = DetachedFileManager()
+
+    class Meta:
+        verbose_name = 'Открепленный файл'
+        verbose_name_plural = 'Открепленные файлы'
+
+    def __str__(self):
+        return self.name
+
+
+class TimelineEntryManager(models.Manager):
+    """Раскладывает рецепты по лентам подписчиков."""
+
+    def is_popular(self, author_id):
+        """У автора слишком много подписчиков для раскладки по лентам."""
+        from users.models import UserCounters
+        followers_count = UserCounters.objects.filter(
+            user_id=author_id
+        ).values_list('followers_count', flat=True).first()
+        return (followers_count or 0) > settings.FEED_FANOUT_LIMIT
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков его автора."""
+        from users.models import Follow
+        if self.is_popular(recipe.author_id):
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id, recipe_id=recipe.pk,
+                    author_id=recipe.author_id, pub_date=recipe.pub_date
+                )
+                for user_id in Follow.objects.filter(
+                    following_id=recipe.author_id
+                ).values_list('user_id', flat=True).iterator()
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту подписчика последние рецепты автора."""
+        if self.is_popular(author_id):
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date
+                )
+                for recipe_id, pub_date in Recipe.objects.filter(
+                    author_id=author_id
+                ).order_by('-pub_date', '-pk').values_list(
+                    'pk', 'pub_date'
+                )[:settings.FEED_BACKFILL_LIMIT]
+            ),
+            ignore_conflicts=True
+        )
+
+    def backfill_followers(self, author_id, since):
+        """Добавляет в ленты всех подписчиков рецепты автора,
+            опубликованные начиная с since.
+
+        Нужно, когда подписчиков у автора снова становится не больше
+        FEED_FANOUT_LIMIT: рецепты, опубликованные, пока их было
+        больше, в ленты не раскладывались.
+        """
+        from users.models import Follow
+        recipes = list(Recipe.objects.filter(
+            author_id=author_id, pub_date__gte=since
+        ).order_by('-pub_date', '-pk').values_list(
+            'pk', 'pub_date'
+        )[:settings.FEED_BACKFILL_LIMIT])
+        if not recipes:
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date
+                )
+                for user_id in Follow.objects.filter(
+                    following_id=author_id
+                ).values_list('user_id', flat=True).iterator()
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+    def prune(self, user_id, author_id):
+        """Убирает из ленты подписчика рецепты автора."""
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписчика его автора.
+
+    Лента заполняется при публикации рецепта и при подписке
+    и очищается при отписке, поэтому чтение ленты не зависит
+    от количества подписок пользователя.
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Подписчик',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор рецепта',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'], name='unique_recipe_in_timeline')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class SimilarityBucket(models.Model):
+    """Корзина LSH, в которую попал рецепт по одной из полос MinHash.
+
+    Рецепты с общими ингредиентами с большой вероятностью попадают
+    в одну корзину хотя бы по одной полосе, поэтому кандидаты
+    в похожие находятся по индексу, без перебора всех рецептов.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='similarity_buckets'
+    )
+    band = models.PositiveSmallIntegerField(verbose_name='Номер полосы')
+    bucket = models.BigIntegerField(verbose_name='Хэш полосы')
+
+    class Meta:
+        verbose_name = 'Корзина похожих рецептов'
+        verbose_name_plural = 'Корзины похожих рецептов'
+        constraints = [models.UniqueConstraint(
+            fields=['recipe', 'band'], name='unique_recipe_band')
+        ]
+        indexes = [
+            models.Index(
+                fields=['bucket'], name='similarity_bucket_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} - {self.band}'
@@ -0,0 +1,160 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Follow, UserCounters
+
+from .images import schedule_image_variants
+from .models import (DetachedFile, Favourites, Ingredient, Recipe,
+                     ShoppingCart, ShoppingListItem, Tag, TimelineEntry,
+                     change_counter)
+
+
+def touch_recipes(queryset):
+    """Обновляет время изменения рецептов."""
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """Убирает ингредиенты удаляемого рецепта из списков покупок."""
+    ShoppingListItem.objects.remove_recipe(
+        ShoppingCart.objects.filter(recipe=instance).values_list(
+            'user_id', flat=True
+        ),
+        instance
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик рецептов автора."""
+    if created and instance.author_id:
+        change_counter(
+            UserCounters.objects.filter(user_id=instance.author_id),
+            'recipes_count', 1
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_timelines(sender, instance, created, raw=False, **kwargs):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if created and not raw and instance.author_id:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    """Добавляет в ленту нового подписчика последние рецепты автора."""
+    if created and not raw:
+        TimelineEntry.objects.backfill(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    """Убирает рецепты автора из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.prune(instance.user_id, instance.following_id)
+
+
+@receiver(pre_save, sender=Recipe)
+def detach_replaced_image_files(sender, instance, raw=False, **kwargs):
+    """Запоминает файлы картинки, которую заменяют в рецепте."""
+    if raw or instance.pk is None:
+        return
+    old = Recipe.objects.filter(pk=instance.pk).only(
+        'image', 'image_variants'
+    ).first()
+    if old is not None:
+        DetachedFile.objects.detach(old.image_files - instance.image_files)
+
+
+@receiver(post_delete, sender=Recipe)
+def detach_deleted_image_files(sender, instance, **kwargs):
+    """Запоминает файлы картинки удаленного рецепта."""
+    DetachedFile.objects.detach(instance.image_files)
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_variants(sender, instance, **kwargs):
+    """Запускает создание уменьшенных копий новой картинки рецепта."""
+    if instance.image_variants_outdated:
+        schedule_image_variants(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    """Уменьшает счетчик рецептов автора."""
+    if instance.author_id:
+        change_counter(
+            UserCounters.objects.filter(user_id=instance.author_id),
+            'recipes_count', -1
+        )
+
+
+@receiver(post_save, sender=Favourites)
+def increase_favourites_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик добавлений рецепта в избранное."""
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            'favourites_count', 1
+        )
+
+
+@receiver(post_delete, sender=Favourites)
+def decrease_favourites_count(sender, instance, **kwargs):
+    """Уменьшает счетчик добавлений рецепта в избранное."""
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        'favourites_count', -1
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def increase_shopping_cart_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик добавлений рецепта в список покупок."""
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            'shopping_cart_count', 1
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def decrease_shopping_cart_count(sender, instance, **kwargs):
+    """Уменьшает счетчик добавлений рецепта в список покупок."""
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        'shopping_cart_count', -1
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_on_tags_change(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """Отмечает рецепты измененными при изменении их тегов."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        touch_recipes(Recipe.objects.filter(tags=instance))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_recipes_on_tag_change(sender, instance, **kwargs):
+    """Отмечает рецепты измененными при изменении или удалении тега."""
+    if not kwargs.get('created'):
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_recipes_on_ingredient_change(sender, instance, created, **kwargs):
+    """Отмечает рецепты измененными при изменении ингредиента."""
+    if not created:
+        touch_recipes(
+            Recipe.objects.filter(ingredient_amount__ingredient=instance)
+        )
@@ -0,0 +1,129 @@
+import hashlib
+import random
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import models
+
+from .models import IngredientAmount, Recipe, SimilarityBucket
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+@lru_cache(maxsize=None)
+def hash_functions(count):
+    """Коэффициенты count хэш-функций вида (a * x + b) mod p.
+
+    Генератор инициализируется постоянным значением, поэтому
+    сигнатуры совпадают во всех процессах и после перезапуска.
+    """
+    rng = random.Random(f'similar-recipes:{count}')
+    return tuple(
+        (rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME))
+        for _ in range(count)
+    )
+
+
+def minhash(ingredient_ids):
+    """Сигнатура MinHash множества ингредиентов."""
+    return [
+        min((a * x + b) % MERSENNE_PRIME for x in ingredient_ids)
+        for a, b in hash_functions(
+            settings.SIMILAR_RECIPES_BANDS * settings.SIMILAR_RECIPES_ROWS
+        )
+    ]
+
+
+def band_buckets(ingredient_ids):
+    """Корзины LSH рецепта: {номер полосы: хэш полосы}.
+
+    Номер полосы входит в хэш, поэтому корзина однозначно
+    определяется одним хэшем.
+    """
+    if not ingredient_ids:
+        return {}
+    signature = minhash(set(ingredient_ids))
+    rows = settings.SIMILAR_RECIPES_ROWS
+    return {
+        band: int.from_bytes(
+            hashlib.blake2b(
+                repr((band, *signature[band * rows:(band + 1) * rows])
+                     ).encode(),
+                digest_size=8
+            ).digest(),
+            'big', signed=True
+        )
+        for band in range(settings.SIMILAR_RECIPES_BANDS)
+    }
+
+
+def index_recipe(recipe_id, ingredient_ids, created=False):
+    """Пересчитывает корзины рецепта по его ингредиентам.
+
+    У сохраненного рецепта есть по строке на каждую полосу, поэтому
+    обычно хэши обновляются одним запросом UPDATE. Вызывается внутри
+    транзакции, в которой меняются ингредиенты.
+    """
+    buckets = band_buckets(ingredient_ids)
+    queryset = SimilarityBucket.objects.filter(recipe_id=recipe_id)
+    if not created:
+        updated = buckets and queryset.update(bucket=models.Case(
+            *(
+                models.When(band=band, then=models.Value(bucket))
+                for band, bucket in buckets.items()
+            ),
+            default=models.F('bucket'),
+            output_field=models.BigIntegerField()
+        ))
+        if buckets and updated == len(buckets):
+            return
+        queryset.delete()
+    SimilarityBucket.objects.bulk_create(
+        SimilarityBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+        for band, bucket in buckets.items()
+    )
+
+
+def recipe_features(recipe_ids):
+    """Ингредиенты и теги рецептов: {id рецепта: множество признаков}."""
+    features = {pk: set() for pk in recipe_ids}
+    for recipe_id, ingredient_id in IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id'):
+        features[recipe_id].add(('ingredient', ingredient_id))
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'tag_id'):
+        features[recipe_id].add(('tag', tag_id))
+    return features
+
+
+def similar_recipe_ids(recipe_id, limit):
+    """id рецептов, больше всего похожих на рецепт, по убыванию сходства.
+
+    Кандидатами считаются рецепты, попавшие с ним хотя бы в одну
+    корзину LSH, то есть имеющие много общих ингредиентов. Не более
+    SIMILAR_RECIPES_CANDIDATES кандидатов с наибольшим числом общих
+    корзин упорядочиваются по коэффициенту Жаккара наборов
+    ингредиентов и тегов.
+    """
+    candidates = list(SimilarityBucket.objects.filter(
+        bucket__in=SimilarityBucket.objects.filter(
+            recipe_id=recipe_id
+        ).values('bucket')
+    ).exclude(recipe_id=recipe_id).values('recipe_id').annotate(
+        shared_buckets=models.Count('pk')
+    ).order_by('-shared_buckets', '-recipe_id').values_list(
+        'recipe_id', flat=True
+    )[:settings.SIMILAR_RECIPES_CANDIDATES])
+    if not candidates:
+        return []
+    features = recipe_features([recipe_id, *candidates])
+    target = features.pop(recipe_id)
+
+    def similarity(pk):
+        return len(target & features[pk]) / len(target | features[pk])
+
+    return sorted(
+        candidates, key=lambda pk: (-similarity(pk), -pk)
+    )[:limit]
@@ -0,0 +1,51 @@
+import hashlib
+import os
+import posixpath
+import threading
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentHashStorage(FileSystemStorage):
+    """Хранилище, сохраняющее файлы под хэшем их содержимого.
+
+    Одинаковые файлы записываются один раз и используются совместно,
+    поэтому удалять их можно только после проверки ссылок на них
+    (см. команду collect_images).
+    """
+
+    _saving = threading.local()
+
+    def get_available_name(self, name, max_length=None):
+        """Оставляет имя как есть: файл с тем же хэшем - тот же файл.
+
+        Если такой файл появился, пока сохранялся этот, повторная
+        попытка записи не нужна, и _save возвращает готовый файл.
+        """
+        if getattr(self._saving, 'name', None) == name:
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(
+            posixpath.dirname(name), digest.hexdigest() + extension
+        )
+        if self.exists(name):
+            # Обновляем время изменения, чтобы сборщик мусора не удалил
+            # файл, на который вот-вот сошлется новая запись.
+            os.utime(self.path(name))
+            return name
+        self._saving.name = name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # Такой же файл одновременно записал другой запрос.
+            if not os.path.isfile(self.path(name)):
+                raise
+            return name
+        finally:
+            self._saving.name = None
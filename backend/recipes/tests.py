@@ -0,0 +1,259 @@
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from users.models import Follow
+
+from .models import (Ingredient, IngredientAmount, Recipe, ShoppingCart,
+                     ShoppingListItem, ShoppingListItemManager, TimelineEntry,
+                     User)
+from .similarity import index_recipe, similar_recipe_ids
+from .storage import ContentHashStorage
+
+
+class ContentHashStorageTest(SimpleTestCase):
+    """Тесты хранилища файлов под хэшем содержимого."""
+
+    def test_identical_upload_race(self):
+        """Одинаковый файл, записанный между проверкой и записью,
+            не приводит к бесконечным попыткам сохранения."""
+        with tempfile.TemporaryDirectory() as location:
+            storage = ContentHashStorage(location=location)
+            first = storage.save('first.png', ContentFile(b'image'))
+            with mock.patch.object(
+                ContentHashStorage, 'exists', return_value=False
+            ):
+                second = storage.save('second.png', ContentFile(b'image'))
+            self.assertEqual(first, second)
+            with storage.open(second) as file:
+                self.assertEqual(file.read(), b'image')
+
+
+class SimilarRecipesTest(TestCase):
+    """Тесты поиска похожих рецептов по индексу LSH."""
+
+    def create_recipe(self, author, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text=name, cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        index_recipe(
+            recipe.pk, [ingredient.pk for ingredient in ingredients],
+            created=True
+        )
+        return recipe
+
+    def test_candidates_share_many_ingredients(self):
+        """Рецепт с одним общим ингредиентом не попадает в кандидаты,
+            а рецепт, отличающийся одним ингредиентом, попадает."""
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(20)
+        ]
+        recipe = self.create_recipe(author, 'рецепт', ingredients[:8])
+        variant = self.create_recipe(
+            author, 'вариант', ingredients[:7] + ingredients[8:9]
+        )
+        other = self.create_recipe(
+            author, 'другой', ingredients[:1] + ingredients[13:20]
+        )
+        result = similar_recipe_ids(recipe.pk, 10)
+        self.assertIn(variant.pk, result)
+        self.assertNotIn(other.pk, result)
+
+
+@override_settings(FEED_FANOUT_LIMIT=1, FEED_WORKERS=0)
+class TimelineBackfillTest(TestCase):
+    """Тесты заполнения лент, когда у автора снова мало подписчиков."""
+
+    def setUp(self):
+        self.author, self.reader, self.other = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass'
+            )
+            for name in ('author', 'reader', 'other')
+        )
+        self.old = self.publish('старый')
+        Follow.objects.create(user=self.reader, following=self.author)
+
+    def publish(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, text=name, cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+
+    def timeline(self):
+        return set(self.reader.timeline_entries.values_list(
+            'recipe_id', flat=True
+        ))
+
+    def test_backfill_recipes_published_while_popular(self):
+        """После отписки в ленты попадают только рецепты, вышедшие,
+            пока подписчиков было больше FEED_FANOUT_LIMIT."""
+        self.reader.timeline_entries.all().delete()
+        follow = Follow.objects.create(user=self.other, following=self.author)
+        popular = self.publish('популярный')
+        self.assertEqual(self.timeline(), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        self.assertEqual(self.timeline(), {popular.pk})
+
+    def test_backfill_not_repeated_without_new_recipes(self):
+        """Повторный переход через порог ничего не добавляет,
+            если новых рецептов не было."""
+        follow = Follow.objects.create(user=self.other, following=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        self.reader.timeline_entries.all().delete()
+        follow = Follow.objects.create(user=self.other, following=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        self.assertEqual(self.timeline(), set())
+
+
+class ShoppingListItemManagerTest(TestCase):
+    """Тесты обновления суммарных списков покупок."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='pass'
+        )
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(3)
+        ]
+
+    def create_recipe(self, amounts):
+        recipe = Recipe.objects.create(
+            author=self.user, name='рецепт', text='текст', cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, ingredient=self.ingredients[index],
+                amount=amount
+            )
+            for index, amount in amounts.items()
+        )
+        return recipe
+
+    def add_to_cart(self, recipe):
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        ShoppingListItem.objects.add_recipe(self.user, recipe)
+
+    def items(self):
+        return set(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ))
+
+    def test_recipe_delete_matches_recompute(self):
+        """После удаления рецепта из корзины и из базы список
+            совпадает с полным пересчетом."""
+        first = self.create_recipe({0: 100, 1: 20})
+        second = self.create_recipe({1: 30, 2: 5})
+        self.add_to_cart(first)
+        self.add_to_cart(second)
+        self.assertEqual(
+            self.items(), set(ShoppingListItem.objects.aggregated())
+        )
+        first.delete()
+        self.assertEqual(
+            self.items(), set(ShoppingListItem.objects.aggregated())
+        )
+        self.assertEqual(self.items(), {
+            (self.user.pk, self.ingredients[1].pk, 30),
+            (self.user.pk, self.ingredients[2].pk, 5),
+        })
+
+    def test_concurrent_insert_is_retried(self):
+        """Строка, вставленная другим запросом после выборки,
+            обновляется при повторной попытке."""
+        ShoppingListItem.objects.create(
+            user=self.user, ingredient=self.ingredients[0], amount=5
+        )
+        change_amounts = ShoppingListItemManager._change_amounts
+        calls = []
+
+        def racing(manager, user_ids, amounts):
+            calls.append(amounts)
+            if len(calls) > 1:
+                return change_amounts(manager, user_ids, amounts)
+            # Первая выборка не видит строку, как будто ее вставили
+            # одновременно с ней.
+            with mock.patch.object(
+                ShoppingListItemManager, 'select_for_update',
+                lambda manager: manager.none()
+            ):
+                return change_amounts(manager, user_ids, amounts)
+
+        with mock.patch.object(
+            ShoppingListItemManager, '_change_amounts', racing
+        ):
+            ShoppingListItem.objects.change_amounts(
+                [self.user.pk], {self.ingredients[0].pk: 3}
+            )
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            self.items(), {(self.user.pk, self.ingredients[0].pk, 8)}
+        )
+
+
+class TimelineEntryManagerTest(TestCase):
+    """Тесты раскладки рецептов по лентам подписчиков."""
+
+    def setUp(self):
+        self.author, self.reader = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass'
+            )
+            for name in ('author', 'reader')
+        )
+
+    def publish(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, text=name, cooking_time=10,
+            image='recipes/images/test.jpg'
+        )
+
+    def timeline(self):
+        return list(TimelineEntry.objects.filter(
+            user=self.reader
+        ).order_by('-pub_date', '-recipe_id').values_list(
+            'recipe_id', flat=True
+        ))
+
+    @override_settings(FEED_BACKFILL_LIMIT=2)
+    def test_backfill_fan_out_and_prune(self):
+        """Подписка добавляет последние рецепты, новый рецепт
+            раскладывается по лентам, отписка очищает ленту."""
+        recipes = [self.publish(f'рецепт {index}') for index in range(3)]
+        follow = Follow.objects.create(
+            user=self.reader, following=self.author
+        )
+        self.assertEqual(
+            set(self.timeline()), {recipes[1].pk, recipes[2].pk}
+        )
+        new = self.publish('новый')
+        self.assertIn(new.pk, self.timeline())
+        follow.delete()
+        self.assertEqual(self.timeline(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_popular_author_is_not_fanned_out(self):
+        """Рецепты автора с подписчиками сверх лимита не раскладываются."""
+        Follow.objects.create(user=self.reader, following=self.author)
+        self.publish('рецепт')
+        self.assertEqual(self.timeline(), [])
@@ -1,20 +1,59 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from recipes.admin_filters import input_filter
 from recipes.models import User
-from .models import Follow
+from .models import Follow, UserCounters
+
+
+class UserCountersInline(admin.StackedInline):
+    model = UserCounters
+    readonly_fields = ('recipes_count', 'followers_count')
+    can_delete = False
+    extra = 0
 
 
 class CustomUserAdmin(UserAdmin):
-    list_filter = (
-        'email', 'username', 'is_staff', 'is_superuser', 'is_active', 'groups'
+    list_display = UserAdmin.list_display + (
+        'recipes_count', 'followers_count'
     )
+    list_select_related = ('counters',)
+    list_filter = ('is_staff', 'is_superuser', 'is_active', 'groups')
+    inlines = (UserCountersInline,)
+
+    def get_counter(self, user, field):
+        try:
+            return getattr(user.counters, field)
+        except UserCounters.DoesNotExist:
+            return 0
+
+    def recipes_count(self, user):
+        """Показывает количество рецептов пользователя."""
+        return self.get_counter(user, 'recipes_count')
+
+    recipes_count.short_description = 'Рецептов'
+
+    def followers_count(self, user):
+        """Показывает количество подписчиков пользователя."""
+        return self.get_counter(user, 'followers_count')
+
+    followers_count.short_description = 'Подписчиков'
 
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'following')
+    list_select_related = ('user', 'following')
     search_fields = ('user__username', 'following__username')
-    list_filter = ('user__username', 'following__username')
+    list_filter = (
+        input_filter(
+            'имени подписчика', 'username', 'user__username__istartswith'
+        ),
+        input_filter(
+            'имени автора', 'following_username',
+            'following__username__istartswith'
+        ),
+    )
+    autocomplete_fields = ('user', 'following')
 
 
 admin.site.unregister(User)
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_popular_since(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    UserCounters = apps.get_model('users', 'UserCounters')
+    UserCounters.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).update(popular_since=models.Subquery(
+        Recipe.objects.filter(
+            author_id=models.OuterRef('user_id')
+        ).order_by('pub_date').values('pub_date')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_similaritybucket'),
+        ('users', '0003_usercounters_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounters',
+            name='popular_since',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Подписчиков больше FEED_FANOUT_LIMIT с'),
+        ),
+        migrations.RunPython(fill_popular_since, migrations.RunPython.noop),
+    ]
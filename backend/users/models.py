@@ -24,3 +24,38 @@ class Follow(models.Model):
 
     def __str__(self) -> str:
         return f'{self.user} - {self.following}'
+
+
+class UserCounters(models.Model):
+    """Счетчики рецептов и подписчиков пользователя."""
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='counters'
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0
+    )
+    popular_since = models.DateTimeField(
+        verbose_name='Подписчиков больше FEED_FANOUT_LIMIT с',
+        null=True,
+        blank=True
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self) -> str:
+        return f'{self.user}'
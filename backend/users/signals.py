@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.feeds import schedule_backfill_followers
+from recipes.models import User, change_counter
+
+from .models import Follow, UserCounters
+
+
+@receiver(post_save, sender=User)
+def create_user_counters(sender, instance, created, **kwargs):
+    """Создает счетчики для нового пользователя."""
+    if created:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Follow)
+def increase_followers_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик подписчиков автора.
+
+    Запоминает, когда подписчиков стало больше FEED_FANOUT_LIMIT:
+    с этого момента рецепты автора не раскладываются по лентам.
+    """
+    if created:
+        change_counter(
+            UserCounters.objects.filter(user_id=instance.following_id),
+            'followers_count', 1,
+            popular_since=Case(
+                When(
+                    Q(followers_count__gte=settings.FEED_FANOUT_LIMIT)
+                    & Q(popular_since__isnull=True),
+                    then=Value(timezone.now())
+                ),
+                default=F('popular_since')
+            )
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def decrease_followers_count(sender, instance, **kwargs):
+    """Уменьшает счетчик подписчиков автора.
+
+    Если подписчиков снова не больше FEED_FANOUT_LIMIT, рецепты автора
+    читаются из лент, и после коммита в них добавляются рецепты,
+    опубликованные, пока подписчиков было больше. Повторный переход
+    через порог добавляет только рецепты, вышедшие с тех пор.
+    """
+    counters = UserCounters.objects.filter(user_id=instance.following_id)
+    change_counter(counters, 'followers_count', -1)
+    since = counters.filter(
+        followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        popular_since__isnull=False
+    ).values_list('popular_since', flat=True).first()
+    if since and counters.filter(popular_since=since).update(
+        popular_since=None
+    ):
+        schedule_backfill_followers(instance.following_id, since)